@@ -5,9 +5,72 @@ import json
 # random world seed ...
 WORLD_SEED = 1024
 
+# simulation ticks per second
+TICK_RATE = 20
+# granularity of timers in seconds
+TIMER_RESOLUTION = 0.05
+
+# pending connections the kernel queues for accept
+LISTEN_BACKLOG = 1024
+
+# game keys applied per connection and second, and the burst allowance
+INPUT_RATE = 15
+INPUT_BURST = 5
+# identical keys kept queued, key repeat beyond that is coalesced
+INPUT_REPEAT = 2
+INPUT_QUEUE_SIZE = 64
+
+# mccp2 compressed output for clients that accept it, zlib level 1-9
+MCCP_ENABLED = True
+MCCP_LEVEL = 6
+
+# frames queued for a slow client before stale ones are dropped, and the
+# output in bytes it may fall behind before it is disconnected
+OUTPUT_QUEUE_FRAMES = 2
+OUTPUT_QUEUE_LIMIT = 256 * 1024
+
+# threads running blocking database work off the game loop
+EXECUTOR_WORKERS = 4
+# logins waiting for the executor before further logins are held back
+LOGIN_QUEUE_LIMIT = 256
+
+# processes hashing passwords and the pbkdf2 cost, raising it re-hashes
+# every account on its next login
+PASSWORD_WORKERS = 2
+PASSWORD_ITERATIONS = 50000
+
+# seconds a disconnected player's session stays in memory for a reconnect,
+# and the most sessions kept
+SESSION_TTL = 300
+SESSION_CACHE_SIZE = 10000
+
+# seconds a connection may take to log in, and may stay without input once
+# logged in, before it is closed
+AUTH_TIMEOUT = 120
+IDLE_TIMEOUT = 1800
+
+# characters of names on the online users line, further players are only
+# counted
+ROSTER_WIDTH = 64
+
+# plain text metrics dump, keep it on the loopback interface
+ADMIN_HOST = '127.0.0.1'
+ADMIN_PORT = 6901
+
+# compact binary protocol for bots and custom clients, see modules/binary.py
+BINARY_HOST = ''
+BINARY_PORT = 6902
+
+# seconds a new process gets to take over on a hot restart (kill -HUP)
+RESTART_TIMEOUT = 10
+
 # init attributes
 ATTRIBUTES = {'level': 1, 'experience': 1, 'health': 10, 'mana': 10, 'strength': 10, 'dexterity': 10, 'zonex': 0, 'zoney': 0}
 
+def count_items(char):
+    # distinct items carried and not equipped
+    return CharItem.select(CharItem, Items).join(Items).where((CharItem.char == char) & (CharItem.equipped == False)).group_by(Items.name).count()
+
 class ReadJson(object):
     def __init__(self, path):
         try:
@@ -55,6 +118,7 @@ class User(object):
     def items(self, value):
         item = Items.get(Items.name == value.name)
         CharItem.create(char=self.char, item=item, condition=item.condition, equipped=False)
+        self.inventory.invalidate()
 
     def equip_item(self, value):
         item = Items.get(Items.name == value.name)
@@ -69,22 +133,25 @@ class User(object):
             char_item.save()
             citem.equipped = True
             citem.save()
+        self.inventory.invalidate()
 
     def unequip_item(self, value):
         item = Items.get(Items.name == value.name)
         char_item = CharItem.select().join(Items).where((CharItem.char == self.char) & (Items.category == value.category) & (CharItem.equipped == True)).get()
         char_item.equipped = False
         char_item.save()
+        self.inventory.invalidate()
 
     def delete_charitem(self, value):
         value.delete_instance()
+        self.inventory.invalidate()
 
     def remove_items(self, items):
         for i in items:
             self._items.remove(i)
 
     def items_amount(self):
-        return CharItem.select(CharItem, Items).join(Items).where((CharItem.char == self.char) & (CharItem.equipped == False)).group_by(Items.name).count()
+        return count_items(self.char)
 
 
     def item_amount(self, item):
@@ -92,6 +159,16 @@ class User(object):
         query = CharItem.select().where((CharItem.char == self.char) & (CharItem.item == i))
         return query.count()
 
+    def item_amounts(self):
+        # pieces carried by item id, equipped ones included
+        query = CharItem.select(CharItem.item, fn.COUNT(CharItem.id)).where(CharItem.char == self.char).group_by(CharItem.item)
+        return dict(query.tuples())
+
+    def get_equipped_items(self):
+        # equipped items by category
+        query = CharItem.select(CharItem, Items).join(Items).where((CharItem.char == self.char) & (CharItem.equipped == True))
+        return dict((char_item.item.category, char_item) for char_item in query)
+
     def get_equipped_item_by_category(self, category):
         try:
             char_item = CharItem.select().join(Items).where((CharItem.char == self.char) & (Items.category == category) & (CharItem.equipped == True)).get()
@@ -183,7 +260,7 @@ class User(object):
 class Item(object):
     def __init__(self, name, attributes):
         self._name = name
-        self._readname = attributes['name']
+        self._readname = str(attributes['name'])
         self._level = attributes['level']
         self._attributes = attributes['attributes']
         self._rate = attributes['rate']
@@ -229,8 +306,9 @@ class Enemy(object):
         self._name = name
         self._health = attributes['health']
         self._level = attributes['level']
-        self._sign = attributes['sign']
-        self._colored_sign = attributes['sign']
+        # json gives unicode, frames are joined from byte strings
+        self._sign = str(attributes['sign'])
+        self._colored_sign = self._sign
         self._etype = attributes['type']
         if self._etype in (3, ):
             self._colored_sign = set_color(self._sign, Colors.REDBOLD)
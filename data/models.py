@@ -1,6 +1,29 @@
 from lib.peewee import *
+import threading
+import time
 
-db = SqliteDatabase('data/config.db')
+class GameDatabase(SqliteDatabase):
+    # keeps the time spent in sql per thread, the game loop's share of it
+    # is the database phase of a tick, and counts statements of all threads
+    def __init__(self, *args, **kwargs):
+        SqliteDatabase.__init__(self, *args, **kwargs)
+        self._timing = threading.local()
+        self._lock = threading.Lock()
+        self.statements = 0
+
+    def execute_sql(self, sql, params=None, require_commit=True):
+        started = time.time()
+        try:
+            return SqliteDatabase.execute_sql(self, sql, params, require_commit)
+        finally:
+            self._timing.elapsed = self.thread_time() + time.time() - started
+            with self._lock:
+                self.statements += 1
+
+    def thread_time(self):
+        return getattr(self._timing, 'elapsed', 0.0)
+
+db = GameDatabase('data/config.db')
 
 class BaseModel(Model):
     # data interface [{'field1': 'val1-1', 'field2': 'val1-2'}]
@@ -0,0 +1,124 @@
+#
+#   metrics.py
+#
+#   Latency histograms in the spirit of HdrHistogram, log-linear buckets so
+#   the relative error stays constant from microseconds to seconds while
+#   recording costs a dict increment.
+#
+import collections
+import time
+
+# bits of precision per power of two, 7 keeps the error below 1%
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+def bucket_index(value):
+    if value < SUB_COUNT:
+        return value
+    exponent = value.bit_length() - SUB_BITS
+    return SUB_COUNT + (exponent - 1) * HALF_COUNT + (value >> exponent) - HALF_COUNT
+
+def bucket_value(index):
+    # highest value that falls into the bucket
+    if index < SUB_COUNT:
+        return index
+    exponent = (index - SUB_COUNT) // HALF_COUNT + 1
+    sub = (index - SUB_COUNT) % HALF_COUNT + HALF_COUNT
+    return ((sub + 1) << exponent) - 1
+
+#
+#   Histogram of durations, recorded in seconds and kept in microseconds
+#
+class Histogram(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1000000))
+        index = bucket_index(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / float(self.count) / 1000000
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(bucket_value(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+#
+#   Named histograms, one registry per process
+#
+class Metrics(object):
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram()
+        return histogram
+
+    def record(self, name, seconds):
+        self.histogram(name).record(seconds)
+
+    def reset(self):
+        self.started = time.time()
+        for histogram in self._histograms.values():
+            histogram.reset()
+
+    def report(self):
+        lines = ['%-16s %9s %9s %s %9s' % ('name', 'count', 'mean', ' '.join('%9s' % ('p%s' % p) for p in PERCENTILES), 'max')]
+        for name in sorted(self._histograms):
+            histogram = self._histograms[name]
+            values = [histogram.mean()] + [histogram.percentile(p) for p in PERCENTILES] + [histogram.max / 1000000.0]
+            lines.append('%-16s %9d %s' % (name, histogram.count, ' '.join('%7.2fms' % (value * 1000) for value in values)))
+        lines.append('since %s, %.0fs' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)), time.time() - self.started))
+        return '\n'.join(lines) + '\n'
+
+#
+#   Per second rate of an ever growing counter over a sliding window
+#
+class Rate(object):
+    def __init__(self, window = 10):
+        self.window = window
+        self._samples = collections.deque()
+
+    def sample(self, total, now = None):
+        now = time.time() if now is None else now
+        self._samples.append((now, total))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+
+    def per_second(self):
+        if len(self._samples) < 2:
+            return 0.0
+        (first, start), (last, end) = self._samples[0], self._samples[-1]
+        if last <= first:
+            return 0.0
+        return (end - start) / (last - first)
@@ -0,0 +1,260 @@
+#
+#   screen.py
+#
+from lib.static import ESC, Colors, BgColors, VT100Codes
+
+TAB_SIZE = 8
+# unchanged cells bridged between two changed runs instead of a cursor jump
+MAX_GAP = 6
+
+# parsed texts kept for reuse, the cache is dropped when it grows past this
+MAX_CACHED = 4096
+
+_cells = {}
+_parsed = {}
+_blank_safe = {}
+
+def cursor(row, col):
+    return '%s[%d;%dH' % (ESC, row + 1, col + 1)
+
+def parse(text):
+    # split a VT100 text stream into rows of cells, a cell is its character
+    # prefixed by the active SGR sequence (no prefix for the default colors)
+    rows = []
+    row = []
+    col = 0
+    sgr = ''
+    i = 0
+    length = len(text)
+    while i < length:
+        c = text[i]
+        i += 1
+        if c == ESC:
+            if text[i:i+1] != '[':
+                continue
+            j = i + 1
+            while j < length and not '@' <= text[j] <= '~':
+                j += 1
+            if text[j:j+1] == 'm':
+                sgr = text[i-1:j+1]
+                if sgr == Colors.RESET:
+                    sgr = ''
+            i = j + 1
+            continue
+        if c == '\n':
+            rows.append(tuple(row))
+            row = []
+            col = 0
+            continue
+        if c == '\r':
+            col = 0
+            continue
+        if c == '\t':
+            width = TAB_SIZE - col % TAB_SIZE
+            c = ' '
+        elif c < ' ':
+            continue
+        else:
+            width = 1
+        cell = sgr + c if sgr else c
+        cell = _cells.setdefault(cell, cell)
+        for _ in xrange(width):
+            if col < len(row):
+                row[col] = cell
+            else:
+                row.append(cell)
+            col += 1
+    rows.append(tuple(row))
+    return rows
+
+def rows(text):
+    # parse() with a cache, the same status or roster text is parsed once
+    # for all clients, the result must not be modified
+    parsed = _parsed.get(text)
+    if parsed is None:
+        if len(_parsed) >= MAX_CACHED:
+            _parsed.clear()
+        parsed = _parsed[text] = tuple(parse(text))
+    return parsed
+
+def join(parts):
+    # rows of consecutive texts, a part continues the last row of the one
+    # before it, parts are expected to leave the default colors behind
+    joined = []
+    for part in parts:
+        if joined:
+            last = joined.pop()
+            joined.append(last + part[0] if last else part[0])
+            joined.extend(part[1:])
+        else:
+            joined.extend(part)
+    return joined
+
+def blank_safe(sgr):
+    # whether a blank looks the same under sgr as under the default colors,
+    # true unless it sets a background or inverts
+    safe = _blank_safe.get(sgr)
+    if safe is None:
+        params = sgr[2:-1].split(';') if sgr else []
+        safe = True
+        i = 0
+        while i < len(params):
+            p = params[i]
+            if p == '38':
+                # 256 color or rgb foreground
+                i += 3 if params[i+1:i+2] == ['5'] else 5
+                continue
+            if not (p in ('', '0', '1', '22', '39') or (len(p) == 2 and p[0] == '3')):
+                safe = False
+                break
+            i += 1
+        _blank_safe[sgr] = safe
+    return safe
+
+#
+#   How the colors of the cells are put to one kind of terminal, frames
+#   are made with the 16 colors and translated on the way out
+#
+class Profile(object):
+    def __init__(self, name, colors = None, mono = False):
+        self.name = name
+        self.colors = colors or {}
+        self.mono = mono
+        self._translated = {}
+
+    def sgr(self, sgr):
+        translated = self._translated.get(sgr)
+        if translated is None:
+            if self.mono:
+                # nothing but the highlight, shown inverted
+                translated = '' if blank_safe(sgr) else VT100Codes.REVERSE
+            else:
+                translated = self.colors.get(sgr, sgr)
+            self._translated[sgr] = translated
+        return translated
+
+MONO = Profile('mono', mono = True)
+ANSI16 = Profile('ansi16')
+ANSI256 = Profile('ansi256', {
+    Colors.RED: ESC+'[0;38;5;160m',
+    Colors.REDBOLD: ESC+'[1;38;5;196m',
+    Colors.GREEN: ESC+'[0;38;5;28m',
+    Colors.GREENBOLD: ESC+'[1;38;5;46m',
+    Colors.YELLOW: ESC+'[0;38;5;178m',
+    Colors.YELLOWBOLD: ESC+'[1;38;5;226m',
+    Colors.BLUE: ESC+'[0;38;5;27m',
+    Colors.BLUEBOLD: ESC+'[1;38;5;39m',
+    BgColors.RED: ESC+'[0;48;5;124m',
+})
+
+def terminal_profile(terminal_type):
+    # profile for the name a client gave with ttype, 16 colors if unknown
+    name = (terminal_type or '').lower()
+    if '256' in name:
+        return ANSI256
+    if name in ('dumb', 'unknown') or name.startswith('vt'):
+        return MONO
+    return ANSI16
+
+def encode(cells, sgr = '', profile = None):
+    # returns the text for a run of cells and the SGR state it leaves behind,
+    # colors only change where a run of them does, blanks take what is set
+    data = []
+    for cell in cells:
+        cell_sgr = cell[:-1]
+        if profile is not None:
+            cell_sgr = profile.sgr(cell_sgr)
+        if cell_sgr != sgr and not (cell[-1] == ' ' and blank_safe(cell_sgr) and blank_safe(sgr)):
+            data.append(cell_sgr or Colors.RESET)
+            sgr = cell_sgr
+        data.append(cell[-1])
+    return ''.join(data), sgr
+
+def changed_runs(old, new):
+    # (start, stop) ranges of new that differ from old, close runs merged
+    runs = []
+    old_length = len(old)
+    start = None
+    gap = 0
+    for col in xrange(len(new)):
+        if col < old_length and old[col] is new[col]:
+            if start is not None:
+                gap += 1
+                if gap > MAX_GAP:
+                    runs.append((start, col - gap + 1))
+                    start = None
+            continue
+        if start is None:
+            start = col
+        gap = 0
+    if start is not None:
+        runs.append((start, len(new) - gap))
+    return runs
+
+#
+#   Shadow copy of the screen a client last received
+#
+class FrameBuffer(object):
+    def __init__(self):
+        self._rows = None
+        self.profile = ANSI16
+        self.width = None
+        self.height = None
+
+    def reset(self):
+        # forces a full repaint with the next update
+        self._rows = None
+
+    def configure(self, profile, size = None):
+        # terminal colors and window size, cells outside of it are cut off,
+        # returns True if that changes the output
+        width, height = size if size and all(size) else (None, None)
+        if (profile, width, height) == (self.profile, self.width, self.height):
+            return False
+        self.profile = profile
+        self.width = width
+        self.height = height
+        self.reset()
+        return True
+
+    def update(self, rows):
+        # returns the VT100 data turning the last frame, given as rows of
+        # cells, into this one
+        if self.height is not None:
+            width = self.width
+            rows = [row if len(row) <= width else row[:width] for row in rows[:self.height]]
+        old_rows = self._rows
+        data = []
+        if old_rows is None:
+            data.append(VT100Codes.CLEARSCRN)
+            old_rows = []
+        sgr = ''
+        for index, row in enumerate(rows):
+            old = old_rows[index] if index < len(old_rows) else ()
+            if row is old or row == old:
+                continue
+            for start, stop in changed_runs(old, row):
+                data.append(cursor(index, start))
+                run, sgr = encode(row[start:stop], sgr, self.profile)
+                data.append(run)
+            if len(row) < len(old):
+                data.append(cursor(index, len(row)))
+                # terminals erase with the current background
+                if sgr:
+                    data.append(Colors.RESET)
+                    sgr = ''
+                data.append(VT100Codes.CLEARLINE)
+        if len(old_rows) > len(rows):
+            data.append(cursor(len(rows), 0))
+            if sgr:
+                data.append(Colors.RESET)
+                sgr = ''
+            data.append(VT100Codes.CLEARDOWN)
+        self._rows = rows
+        if not data:
+            return ''
+        if sgr:
+            data.append(Colors.RESET)
+        # leave the cursor where the full frame would have left it
+        data.append(cursor(len(rows) - 1, len(rows[-1])))
+        return ''.join(data)
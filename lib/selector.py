@@ -0,0 +1,174 @@
+#
+#   selector.py
+#
+#   Readiness notification in the spirit of the python 3 selectors module,
+#   epoll where available, poll or select otherwise.
+#
+import errno
+import select
+
+EVENT_READ = 1
+EVENT_WRITE = 2
+
+class BaseSelector(object):
+    def __init__(self):
+        self._channels = {}
+
+    def __len__(self):
+        return len(self._channels)
+
+    def register(self, fd, events, channel):
+        self._channels[fd] = channel
+
+    def modify(self, fd, events):
+        pass
+
+    def unregister(self, fd):
+        return self._channels.pop(fd, None)
+
+    def select(self, timeout = None):
+        raise NotImplementedError
+
+class EpollSelector(BaseSelector):
+    def __init__(self):
+        BaseSelector.__init__(self)
+        self._epoll = select.epoll()
+
+    def _mask(self, events):
+        mask = 0
+        if events & EVENT_READ:
+            mask |= select.EPOLLIN
+        if events & EVENT_WRITE:
+            mask |= select.EPOLLOUT
+        return mask
+
+    def register(self, fd, events, channel):
+        self._epoll.register(fd, self._mask(events))
+        BaseSelector.register(self, fd, events, channel)
+
+    def modify(self, fd, events):
+        self._epoll.modify(fd, self._mask(events))
+
+    def unregister(self, fd):
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, ValueError):
+            pass
+        return BaseSelector.unregister(self, fd)
+
+    def select(self, timeout = None):
+        if timeout is None:
+            timeout = -1
+        try:
+            ready = self._epoll.poll(timeout, max(len(self._channels), 1))
+        except IOError, e:
+            if e.errno == errno.EINTR:
+                return []
+            raise
+        result = []
+        for fd, mask in ready:
+            channel = self._channels.get(fd)
+            if channel is None:
+                continue
+            events = 0
+            if mask & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+                events |= EVENT_READ
+            if mask & (select.EPOLLOUT | select.EPOLLHUP | select.EPOLLERR):
+                events |= EVENT_WRITE
+            result.append((channel, events))
+        return result
+
+class PollSelector(BaseSelector):
+    def __init__(self):
+        BaseSelector.__init__(self)
+        self._poll = select.poll()
+
+    def _mask(self, events):
+        mask = 0
+        if events & EVENT_READ:
+            mask |= select.POLLIN
+        if events & EVENT_WRITE:
+            mask |= select.POLLOUT
+        return mask
+
+    def register(self, fd, events, channel):
+        self._poll.register(fd, self._mask(events))
+        BaseSelector.register(self, fd, events, channel)
+
+    def modify(self, fd, events):
+        self._poll.modify(fd, self._mask(events))
+
+    def unregister(self, fd):
+        try:
+            self._poll.unregister(fd)
+        except KeyError:
+            pass
+        return BaseSelector.unregister(self, fd)
+
+    def select(self, timeout = None):
+        if timeout is not None:
+            timeout = int(timeout * 1000)
+        try:
+            ready = self._poll.poll(timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        result = []
+        for fd, mask in ready:
+            channel = self._channels.get(fd)
+            if channel is None:
+                continue
+            events = 0
+            if mask & (select.POLLIN | select.POLLHUP | select.POLLERR):
+                events |= EVENT_READ
+            if mask & (select.POLLOUT | select.POLLHUP | select.POLLERR):
+                events |= EVENT_WRITE
+            result.append((channel, events))
+        return result
+
+class SelectSelector(BaseSelector):
+    def __init__(self):
+        BaseSelector.__init__(self)
+        self._readers = set()
+        self._writers = set()
+
+    def register(self, fd, events, channel):
+        BaseSelector.register(self, fd, events, channel)
+        self.modify(fd, events)
+
+    def modify(self, fd, events):
+        if events & EVENT_READ:
+            self._readers.add(fd)
+        else:
+            self._readers.discard(fd)
+        if events & EVENT_WRITE:
+            self._writers.add(fd)
+        else:
+            self._writers.discard(fd)
+
+    def unregister(self, fd):
+        self._readers.discard(fd)
+        self._writers.discard(fd)
+        return BaseSelector.unregister(self, fd)
+
+    def select(self, timeout = None):
+        try:
+            r, w, _ = select.select(self._readers, self._writers, [], timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        ready = {}
+        for fd in r:
+            ready[fd] = EVENT_READ
+        for fd in w:
+            ready[fd] = ready.get(fd, 0) | EVENT_WRITE
+        return [(self._channels[fd], events) for fd, events in ready.items() if fd in self._channels]
+
+if hasattr(select, 'epoll'):
+    DefaultSelector = EpollSelector
+elif hasattr(select, 'poll'):
+    DefaultSelector = PollSelector
+else:
+    DefaultSelector = SelectSelector
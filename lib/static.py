@@ -10,6 +10,8 @@ class VT100Codes:
     JMPHOME = ESC+"[H"
     CLEARSCRN = ESC+"[2J"
     CLEARDOWN = ESC+"[J"
+    CLEARLINE = ESC+"[K"
+    REVERSE = ESC+"[7m"
 
 class Colors:
     REDBOLD = ESC+"[1;31m"
@@ -0,0 +1,146 @@
+#
+#   telnet.py
+#
+#   Incremental telnet/ANSI input parser, turns the byte stream of a
+#   connection into discrete events no matter how it was split into reads.
+#
+import struct
+from lib.static import ESC
+
+IAC = chr(255)
+DONT = chr(254)
+DO = chr(253)
+WONT = chr(252)
+WILL = chr(251)
+SB = chr(250)
+SE = chr(240)
+
+ECHO = chr(1)
+SGA = chr(3)
+TTYPE = chr(24)
+NAWS = chr(31)
+LINEMODE = chr(34)
+COMPRESS2 = chr(86)
+
+# ttype subnegotiation commands
+IS = chr(0)
+SEND = chr(1)
+
+# event types
+KEY = 0
+COMMAND = 1
+WINDOW_SIZE = 2
+TERMINAL_TYPE = 3
+
+ENTER = '\r'
+BACKSPACE = ('\x08', '\x7f')
+
+# longest subnegotiation kept, anything above is garbage
+MAX_SUBNEGOTIATION = 64
+
+DATA, COMMAND_BYTE, OPTION_BYTE, SUBNEGOTIATION, SUBNEGOTIATION_IAC, ESCAPE, CSI = range(7)
+
+def command(cmd, option):
+    return IAC + cmd + option
+
+def subnegotiation(option, data):
+    return IAC + SB + option + data.replace(IAC, IAC + IAC) + IAC + SE
+
+class TelnetParser(object):
+    def __init__(self):
+        self._state = DATA
+        self._command = None
+        self._buffer = []
+        self._cr = False
+
+    def escape_pending(self):
+        # a lone ESC can't be told apart from the start of a sequence yet
+        return self._state == ESCAPE
+
+    def flush(self):
+        # give up waiting for the rest of an escape sequence
+        if self._state == ESCAPE:
+            self._state = DATA
+            return [(KEY, ESC)]
+        return []
+
+    def feed(self, data):
+        events = []
+        for c in data:
+            state = self._state
+            if state == DATA:
+                if c == IAC:
+                    self._state = COMMAND_BYTE
+                elif c == ESC:
+                    self._state = ESCAPE
+                    self._cr = False
+                elif self._cr and c in ('\n', '\0'):
+                    # second half of a cr lf / cr nul line end
+                    self._cr = False
+                elif c in ('\r', '\n'):
+                    self._cr = c == '\r'
+                    events.append((KEY, ENTER))
+                else:
+                    self._cr = False
+                    events.append((KEY, c))
+            elif state == COMMAND_BYTE:
+                if c in (WILL, WONT, DO, DONT):
+                    self._command = c
+                    self._state = OPTION_BYTE
+                elif c == SB:
+                    self._buffer = []
+                    self._state = SUBNEGOTIATION
+                elif c == IAC:
+                    events.append((KEY, c))
+                    self._state = DATA
+                else:
+                    # nop, go ahead, break and friends
+                    self._state = DATA
+            elif state == OPTION_BYTE:
+                events.append((COMMAND, (self._command, c)))
+                self._state = DATA
+            elif state == SUBNEGOTIATION:
+                if c == IAC:
+                    self._state = SUBNEGOTIATION_IAC
+                elif len(self._buffer) < MAX_SUBNEGOTIATION:
+                    self._buffer.append(c)
+            elif state == SUBNEGOTIATION_IAC:
+                if c == SE:
+                    event = self._subnegotiation(''.join(self._buffer))
+                    if event:
+                        events.append(event)
+                    self._buffer = []
+                    self._state = DATA
+                else:
+                    # escaped 255 inside the subnegotiation
+                    if len(self._buffer) < MAX_SUBNEGOTIATION:
+                        self._buffer.append(c)
+                    self._state = SUBNEGOTIATION
+            elif state == ESCAPE:
+                if c in ('[', 'O'):
+                    self._buffer = [ESC, c]
+                    self._state = CSI
+                else:
+                    events.append((KEY, ESC))
+                    self._state = DATA
+                    events.extend(self.feed(c))
+            elif state == CSI:
+                self._buffer.append(c)
+                if '@' <= c <= '~' or self._buffer[1] == 'O':
+                    events.append((KEY, ''.join(self._buffer)))
+                    self._buffer = []
+                    self._state = DATA
+                elif len(self._buffer) > MAX_SUBNEGOTIATION:
+                    self._buffer = []
+                    self._state = DATA
+        return events
+
+    def _subnegotiation(self, data):
+        if not data:
+            return None
+        option = data[0]
+        if option == NAWS and len(data) == 5:
+            return (WINDOW_SIZE, struct.unpack('>HH', data[1:]))
+        if option == TTYPE and data[1:2] == IS:
+            return (TERMINAL_TYPE, data[2:])
+        return None
@@ -0,0 +1,106 @@
+#
+#   timerwheel.py
+#
+#   Hierarchical timer wheel, scheduling and cancelling are O(1) no matter
+#   how many timers are pending, firing costs O(1) per timer plus a cascade
+#   of the coarser levels every SLOTS ticks.
+#
+import math
+
+SLOT_BITS = 8
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 4
+
+class Timer(object):
+    __slots__ = ('tick', 'callback', 'args', 'active', '_slot')
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.active = True
+        self._slot = None
+
+class TimerWheel(object):
+    def __init__(self, resolution, now):
+        self.resolution = resolution
+        self._tick = int(now / resolution)
+        self._levels = [[set() for _ in xrange(SLOTS)] for _ in xrange(LEVELS)]
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, deadline, callback, *args):
+        tick = max(self._tick + 1, int(math.ceil(deadline / self.resolution)))
+        timer = Timer(tick, callback, args)
+        self._insert(timer)
+        self._count += 1
+        return timer
+
+    def cancel(self, timer):
+        timer.active = False
+        if timer._slot is not None:
+            timer._slot.discard(timer)
+            timer._slot = None
+            self._count -= 1
+
+    def _insert(self, timer):
+        ticks = max(0, timer.tick - self._tick)
+        for level in xrange(LEVELS):
+            shift = SLOT_BITS * level
+            if ticks < 1 << (shift + SLOT_BITS):
+                break
+        else:
+            # further out than the wheel reaches, parked in the last slot in
+            # reach and moved on from there when it cascades
+            ticks = (1 << (shift + SLOT_BITS)) - 1
+        slot = self._levels[level][((self._tick + ticks) >> shift) & SLOT_MASK]
+        slot.add(timer)
+        timer._slot = slot
+
+    def _cascade(self):
+        for level in xrange(1, LEVELS):
+            shift = SLOT_BITS * level
+            if self._tick & ((1 << shift) - 1):
+                return
+            slot = self._levels[level][(self._tick >> shift) & SLOT_MASK]
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                self._insert(timer)
+
+    def next_deadline(self):
+        # time of the next slot holding timers at the finest level, or of
+        # the next cascade, None without timers
+        if not self._count:
+            return None
+        level0 = self._levels[0]
+        tick = self._tick + 1
+        while tick & SLOT_MASK:
+            if level0[tick & SLOT_MASK]:
+                break
+            tick += 1
+        return tick * self.resolution
+
+    def advance(self, now):
+        # runs every timer due by now
+        # the epsilon keeps a deadline from next_deadline() due at its time
+        target = int(now / self.resolution + 1e-6)
+        while self._tick < target and self._count:
+            self._tick += 1
+            self._cascade()
+            slot = self._levels[0][self._tick & SLOT_MASK]
+            if not slot:
+                continue
+            timers = list(slot)
+            slot.clear()
+            self._count -= len(timers)
+            for timer in timers:
+                timer._slot = None
+                if timer.active:
+                    timer.active = False
+                    timer.callback(*timer.args)
+        if self._tick < target:
+            self._tick = target
@@ -0,0 +1,50 @@
+#
+#   wire.py
+#
+#   Length prefixed binary messages, every payload goes out behind a type
+#   byte and its length as a 16 bit big endian integer.
+#
+import struct
+
+HEADER = struct.Struct('>BH')
+MAX_PAYLOAD = 0xffff
+
+def message(kind, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+def run_length(data):
+    # (count, byte) pairs, runs longer than 255 are split
+    out = []
+    i = 0
+    n = len(data)
+    while i < n:
+        value = data[i]
+        j = i + 1
+        while j < n and j - i < 255 and data[j] == value:
+            j += 1
+        out.append(chr(j - i) + value)
+        i = j
+    return ''.join(out)
+
+class MessageParser(object):
+    def __init__(self, max_payload = MAX_PAYLOAD):
+        self.max_payload = max_payload
+        self._buffer = ''
+
+    def feed(self, data):
+        # (kind, payload) of every message completed by data, raises
+        # ValueError for a payload above the limit
+        buf = self._buffer + data
+        messages = []
+        offset = 0
+        while len(buf) - offset >= HEADER.size:
+            kind, length = HEADER.unpack_from(buf, offset)
+            if length > self.max_payload:
+                raise ValueError('message of %d bytes' % length)
+            end = offset + HEADER.size + length
+            if end > len(buf):
+                break
+            messages.append((kind, buf[offset + HEADER.size:end]))
+            offset = end
+        self._buffer = buf[offset:]
+        return messages
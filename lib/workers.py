@@ -0,0 +1,38 @@
+#
+#   workers.py
+#
+import Queue
+import sys
+import threading
+
+#
+#   Fixed size thread pool for blocking work (database, disk)
+#
+class WorkerPool(object):
+    def __init__(self, size, name = 'worker'):
+        self.size = size
+        self._queue = Queue.Queue()
+        self._threads = []
+        for index in xrange(size):
+            thread = threading.Thread(target = self._work, name = '%s-%d' % (name, index))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __len__(self):
+        # jobs waiting for a free worker
+        return self._queue.qsize()
+
+    def submit(self, func, args, done):
+        # done(result, error) is called from the worker thread
+        self._queue.put((func, args, done))
+
+    def _work(self):
+        while True:
+            func, args, done = self._queue.get()
+            try:
+                result = func(*args)
+            except Exception, e:
+                done(None, e)
+            else:
+                done(result, None)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python2.7
+#
+#   loadgen.py
+#
+#   Headless load generator, simulated telnet players against a local server.
+#
+#   ./loadgen.py --players 500 --duration 60
+#
+#   Every player shares the zone and sees the others move, so the client
+#   can't tell which frame answers its key. The input to frame latency is
+#   the server's client.latency histogram, read from the admin port at the
+#   end, it covers everything since the server started or its last reset.
+#
+import argparse
+import errno
+import heapq
+import itertools
+import random
+import socket
+import time
+
+from lib.telnet import TelnetParser, KEY
+from modules.network import Reactor, Transport, Protocol, raise_fd_limit
+
+MOVE_KEYS = ('w', 'a', 's', 'd', 'W', 'A', 'S', 'D', '\x1b[A', '\x1b[B', '\x1b[C', '\x1b[D')
+INVENTORY_KEY = 'i'
+# chance that a key press toggles the inventory instead of walking
+INVENTORY_CHANCE = 0.05
+
+CONNECTING, USERNAME, PASSWORD, LOGIN, PLAYING, CLOSED = range(6)
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+class Stats(object):
+    def __init__(self):
+        self.connected = 0
+        self.logged_in = 0
+        self.disconnects = 0
+        self.refused = 0
+        self.failed = 0
+        self.keys = 0
+        self.bytes_received = 0
+        self.reads = 0
+        self.connect_times = []
+        self.login_times = []
+
+    def report(self, elapsed, online):
+        print '%6.1fs  online %d/%d  disconnects %d  refused %d  keys %d  recv %.1f KB/s' % (
+            elapsed, online, self.connected, self.disconnects, self.refused, self.keys,
+            self.bytes_received / 1024.0 / max(elapsed, 0.001))
+
+    def summary(self, elapsed, server_latency):
+        print
+        print 'players logged in  %d (%d disconnects, %d refused, %d failed logins)' % (self.logged_in, self.disconnects, self.refused, self.failed)
+        print 'bytes received     %d (%.1f KB/s, %d reads)' % (self.bytes_received, self.bytes_received / 1024.0 / elapsed, self.reads)
+        print 'keys sent          %d' % (self.keys,)
+        for name, values in (('connect', self.connect_times), ('login', self.login_times)):
+            print '%-18s p50 %.1f ms  p90 %.1f ms  p99 %.1f ms  max %.1f ms  (n=%d)' % (
+                name, percentile(values, 50) * 1000, percentile(values, 90) * 1000,
+                percentile(values, 99) * 1000, (max(values) if values else 0.0) * 1000, len(values))
+        print 'input to frame     %s' % (server_latency or 'not available, is the admin port reachable?')
+
+#
+#   One simulated player, scripted through the auth flow of GameHandler
+#
+class Player(Protocol):
+    def __init__(self, generator, name, password):
+        self.generator = generator
+        self.name = name
+        self.password = password
+        self.state = CONNECTING
+        self.parser = TelnetParser()
+        self.text = ''
+        self.started = time.time()
+        self.inventory = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        stats = self.generator.stats
+        now = time.time()
+        stats.bytes_received += len(data)
+        stats.reads += 1
+        if self.state == CONNECTING:
+            stats.connected += 1
+            stats.connect_times.append(now - self.started)
+            self.state = USERNAME
+        if self.state == PLAYING:
+            return
+        # auth prompts, only the printable text matters
+        self.text += ''.join(value for event, value in self.parser.feed(data) if event == KEY and len(value) == 1)
+        if self.state == USERNAME and self.text.endswith('username: '):
+            self.text = ''
+            self.state = PASSWORD
+            self.transport.write(self.name + '\r\n')
+        elif self.state == PASSWORD and self.text.endswith('password: '):
+            self.text = ''
+            self.state = LOGIN
+            self.login_sent = now
+            self.transport.write(self.password + '\r\n')
+        elif self.state == LOGIN and '\x1b[2J' in data:
+            stats.logged_in += 1
+            stats.login_times.append(now - self.login_sent)
+            self.state = PLAYING
+            self.generator.schedule(self)
+        elif self.state == LOGIN and 'Error' in self.text:
+            # the name exists with another password
+            stats.failed += 1
+            self.transport.close()
+
+    def press_key(self):
+        if self.state != PLAYING:
+            return
+        stats = self.generator.stats
+        if random.random() < INVENTORY_CHANCE or self.inventory:
+            key = INVENTORY_KEY
+            self.inventory = not self.inventory
+        else:
+            key = random.choice(MOVE_KEYS)
+        stats.keys += 1
+        self.transport.write(key)
+        self.generator.schedule(self)
+
+    def connection_lost(self, error):
+        if self.state != CLOSED:
+            if self.generator.stopping:
+                pass
+            elif self.state == CONNECTING:
+                self.generator.stats.refused += 1
+            else:
+                self.generator.stats.disconnects += 1
+            self.state = CLOSED
+            self.generator.online -= 1
+
+class LoadGenerator(object):
+    def __init__(self, args):
+        self.args = args
+        self.reactor = Reactor(0)
+        self.stats = Stats()
+        self.online = 0
+        self.stopping = False
+        self.players = []
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, callback, *args):
+        heapq.heappush(self._timers, (time.time() + delay, next(self._sequence), callback, args))
+
+    def schedule(self, player):
+        # exponential think time around the configured key rate
+        self.call_later(random.expovariate(self.args.rate), player.press_key)
+
+    def connect(self, index):
+        name = '%s%05d' % (self.args.prefix, index)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(0)
+        error = sock.connect_ex((self.args.host, self.args.port))
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.stats.refused += 1
+            sock.close()
+            return
+        player = Player(self, name[:8], self.args.password)
+        Transport(self.reactor, sock, player)
+        self.players.append(player)
+        self.online += 1
+
+    def server_latency(self):
+        # the client.latency line of the admin dump, None if unreachable
+        try:
+            sock = socket.create_connection((self.args.host, self.args.admin_port), 5)
+            sock.sendall('\n')
+            dump = []
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                dump.append(data)
+            sock.close()
+        except socket.error:
+            return None
+        for line in ''.join(dump).splitlines():
+            if line.startswith('client.latency '):
+                fields = line.split()
+                # count, mean, p50, p90, p99, p99.9, max
+                return 'p50 %s  p90 %s  p99 %s  max %s  (n=%s, server side)' % (fields[3], fields[4], fields[5], fields[7], fields[1])
+        return None
+
+    def run(self):
+        args = self.args
+        started = time.time()
+        for index in xrange(args.players):
+            self.call_later(index / float(args.ramp), self.connect, index)
+        last_report = started
+        end = started + args.duration
+        while True:
+            now = time.time()
+            if now >= end:
+                break
+            timeout = end - now
+            if self._timers:
+                timeout = max(0.0, min(timeout, self._timers[0][0] - now))
+            self.reactor.poll(min(timeout, 1.0))
+            now = time.time()
+            while self._timers and self._timers[0][0] <= now:
+                _, _, callback, callback_args = heapq.heappop(self._timers)
+                callback(*callback_args)
+            if now - last_report >= args.interval:
+                last_report = now
+                self.stats.report(now - started, self.online)
+        self.stopping = True
+        for player in self.players:
+            player.transport.close()
+        self.stats.summary(time.time() - started, self.server_latency())
+
+def main():
+    parser = argparse.ArgumentParser(description = 'simulated telnet players for load tests')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 6900)
+    parser.add_argument('--admin-port', type = int, default = 6901, help = 'server metrics, for the input latency')
+    parser.add_argument('--players', type = int, default = 50)
+    parser.add_argument('--duration', type = float, default = 60, help = 'seconds')
+    parser.add_argument('--ramp', type = float, default = 100, help = 'new connections per second')
+    parser.add_argument('--rate', type = float, default = 2, help = 'keys per second and player')
+    parser.add_argument('--interval', type = float, default = 5, help = 'seconds between reports')
+    parser.add_argument('--prefix', default = 'lg', help = 'user name prefix, at most 3 characters')
+    parser.add_argument('--password', default = 'load')
+    args = parser.parse_args()
+    raise_fd_limit()
+    LoadGenerator(args).run()
+
+if __name__ == '__main__':
+    main()
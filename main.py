@@ -1,44 +1,158 @@
 from modules.server import GameServer
 from modules.render import Header, Auth, OnlineUsers, Character, Info, Inventory
 from lib.static import *
-from modules.server import GameServer
+from modules.network import Reactor, raise_fd_limit
+from modules.scheduler import Scheduler
+from modules.admin import AdminServer
+from modules.binary import BinaryServer
+from modules import handoff
+from modules.auth import PasswordHasher
+from lib.screen import rows, join
 from modules.world import World
 from config import *
-
-import asyncore
-import time
+import os
+import signal
+import sys
 
 class GameMain(object):
     def __init__(self):
+        # sockets and sessions of the previous process on a hot restart
+        state = handoff.receive()
+        # forks its workers, so it comes before any thread or socket
+        self.passwords = PasswordHasher(PASSWORD_WORKERS, PASSWORD_ITERATIONS, handoff.inherited(state))
+        state = state or {'game': None, 'admin': None, 'binary': None, 'sessions': []}
         self.world = World()
-        self.game_server = GameServer('', 6900, self.world)
+        raise_fd_limit()
+        self.scheduler = Scheduler(TICK_RATE, Reactor(EXECUTOR_WORKERS), TIMER_RESOLUTION)
+        self.game_server = GameServer('', 6900, self.world, self.scheduler, self.passwords, handoff.take_socket(state['game']))
+        self.admin_server = AdminServer(ADMIN_HOST, ADMIN_PORT, self.scheduler, self.game_server, self.world, handoff.take_socket(state['admin']))
+        self.binary_server = BinaryServer(BINARY_HOST, BINARY_PORT, self.game_server, handoff.take_socket(state.get('binary')))
+        self.game_server.adopt(state['sessions'])
+        handoff.ready()
+        self.db_time = 0.0
+        # parsed online users line, made again when the roster changes
+        self.roster = None
+        # kill -USR1 <pid> prints the tick and latency histograms
+        signal.signal(signal.SIGUSR1, self.request_metrics)
+        # kill -HUP <pid> restarts into the current code, keeping the players
+        signal.signal(signal.SIGHUP, self.request_restart)
+
+    def request_restart(self, signum, frame):
+        self.scheduler.reactor.call_soon_threadsafe(self.restart)
+
+    def restart(self):
+        sessions = self.game_server.detach()
+        self.admin_server.detach()
+        self.binary_server.detach()
+        try:
+            state = {'game': self.game_server.fileno(), 'admin': self.admin_server.fileno(), 'binary': self.binary_server.fileno(), 'sessions': sessions}
+            fds = [state['game'], state['admin'], state['binary']] + [session['fd'] for session in sessions]
+            print 'Hot restart, handing over %d connections' % len(sessions)
+            taken = handoff.spawn(state, fds, RESTART_TIMEOUT)
+        except Exception, e:
+            # the channels are detached already, the players must not go
+            # down with the restart
+            print e
+            taken = False
+        if taken:
+            self.passwords.close()
+            sys.stdout.flush()
+            # the sockets live on in the new process, no goodbyes
+            os._exit(0)
+        print 'Hot restart failed, resuming'
+        self.admin_server.attach()
+        self.binary_server.attach()
+        self.game_server.attach(sessions)
+
+    def request_metrics(self, signum, frame):
+        # out of the signal handler, the report is printed by the loop
+        self.scheduler.reactor.call_soon_threadsafe(self.print_metrics)
+
+    def print_metrics(self):
+        scheduler = self.scheduler
+        print '%d ticks, %d overruns, %d connections' % (scheduler.ticks, scheduler.overruns, len(self.game_server.connections))
+        print scheduler.metrics.report()
+
+    def simulate(self):
+        self.db_time = db.thread_time()
+        self.game_server.update()
+
+    def render(self):
+        server = self.game_server
+        # changes in a zone only concern the handlers looking at it
+        for zone_x, zone_y in self.world.pop_dirty_zones():
+            for handler in server.interest.subscribers(zone_x, zone_y):
+                server.redraw(handler)
+        dirty = server.dirty
+        server.dirty = set()
+        roster_changed = server.roster_changed
+        server.roster_changed = False
+        if not dirty and not roster_changed:
+            return
+        # frames are put together from parsed rows, the roster and the zone
+        # body are parsed once and shared by everybody showing them
+        if roster_changed or self.roster is None:
+            self.roster = rows(OnlineUsers.write(server.roster.line()))
+        roster = self.roster
+        # binary clients get the state itself, no text
+        names = server.roster.text()
+        for handler in dirty:
+            if handler.state and handler.run:
+                handler.run = False
+                self.guarded(handler, self.render_frame, handler, roster, names)
+        if roster_changed:
+            # everybody else only gets the new roster line
+            for handler in server.connections.values():
+                if not handler.state or handler in dirty:
+                    continue
+                self.guarded(handler, self.render_roster, handler, roster, names)
+
+    def guarded(self, handler, func, *args):
+        # a frame that can't be made only costs its own client
+        try:
+            func(*args)
+        except Exception, e:
+            print '%s: render failed, %s' % (handler.address[0], e)
+            handler.handle_close()
+
+    def render_frame(self, handler, roster, names):
+        if handler.protocol == 'binary':
+            handler.send_state(names)
+            return
+        frame = [rows(Header.write(handler.address)), roster]
+        frame.append(rows(Character.write(handler)))
+        if handler.state == States.WORLD:
+            frame.append(handler.entity.render_rows())
+            info = Info.write(handler.user)
+            if info:
+                frame.append(rows(info))
+        elif handler.state == States.INVENTORY:
+            frame.append(rows(handler.inventory.write(handler.user)))
+        # logout state
+        handler.frame_parts = frame
+        self.send_frame(handler)
+
+    def render_roster(self, handler, roster, names):
+        if handler.protocol == 'binary':
+            handler.send_state(names)
+        elif handler.frame_parts:
+            handler.frame_parts[1] = roster
+            self.send_frame(handler)
+
+    def send_frame(self, handler):
+        handler.drop_backlog()
+        data = handler.screen.update(join(handler.frame_parts))
+        if data:
+            handler.send_data(data, frame = True)
+
+    def flush(self):
+        # sql the game loop ran itself during simulate and render
+        self.scheduler.metrics.record('tick.db', db.thread_time() - self.db_time)
+        self.game_server.flush()
 
     def run(self):
         #NOTE game loop
-        while True:
-            new_connections = {}
-            for addr, handler in self.game_server.connections.items():
-                handler.tick()
-                if handler.shutdown:
-                    del handler
-                    continue
-                new_connections[addr] = handler
-                if handler.state and handler.run:
-                    handler.send_data(VT100Codes.CLEARSCRN)
-                    handler.send_data(VT100Codes.JMPHOME)
-                    handler.send_data(Header.write(addr))
-                    handler.send_data(OnlineUsers.write(self.game_server.connections.values()))
-                    handler.send_data(Character.write(handler))
-                    if handler.state == States.WORLD:
-                        handler.send_data(handler.entity.render_world())
-                        handler.send_data(Info.write(handler.user))
-                    elif handler.state == States.INVENTORY:
-                        handler.send_data(handler.inventory.write(handler.user))
-                    # logout state
-                    handler.run = False
-            self.game_server.connections = new_connections
-            asyncore.loop(timeout = 0.1, count = 1)
+        self.scheduler.run(self.simulate, self.render, self.flush)
 
 server = GameMain()
 server.run()
-
@@ -0,0 +1,114 @@
+#
+#   admin.py
+#
+#   Plain text dump of the server internals on a local port, answers the
+#   first line of a request, http or not.
+#
+#   curl http://localhost:6901/
+#   echo | nc localhost 6901
+#
+from config import *
+from lib.metrics import Rate
+from modules.network import Protocol, Transport, Listener
+
+import resource
+import time
+
+# seconds between samples of the rate counters
+SAMPLE_INTERVAL = 1.0
+MAX_REQUEST = 4096
+
+def rss_bytes():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    # peak instead of current size where there is no procfs
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class AdminHandler(Protocol):
+    def __init__(self, admin):
+        self.admin = admin
+        self.request = ''
+        self.answered = False
+
+    def data_received(self, data):
+        if self.answered:
+            return
+        self.request += data
+        if '\n' not in self.request and len(self.request) < MAX_REQUEST:
+            return
+        self.answered = True
+        body = self.admin.dump()
+        if self.request.split(' ', 1)[0] in ('GET', 'HEAD'):
+            header = 'HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n\r\n' % len(body)
+            if self.request.startswith('HEAD'):
+                body = ''
+            body = header + body
+        self.transport.write(body)
+        self.transport.close_when_done()
+
+class AdminServer(Listener):
+    def __init__(self, host, port, scheduler, server, world, sock = None):
+        Listener.__init__(self, scheduler.reactor, host, port, 16, sock)
+        self.scheduler = scheduler
+        self.server = server
+        self.world = world
+        self.started = time.time()
+        self.tick_rate = Rate()
+        self.sql_rate = Rate()
+        self.sample()
+
+    def sample(self):
+        now = time.time()
+        self.tick_rate.sample(self.scheduler.ticks, now)
+        self.sql_rate.sample(db.statements, now)
+        self.scheduler.call_later(SAMPLE_INTERVAL, self.sample)
+
+    def handle_accept(self, sock, addr):
+        Transport(self.reactor, sock, AdminHandler(self))
+
+    def dump(self):
+        scheduler = self.scheduler
+        server = self.server
+        handlers = server.connections.values()
+        queued = [handler.transport.queued_bytes for handler in handlers]
+        stats = [
+            ('uptime', '%.0f' % (time.time() - self.started)),
+            ('connections', len(handlers)),
+            ('connections.binary', sum(1 for handler in handlers if handler.protocol == 'binary')),
+            ('players', len(server.roster)),
+            ('ticks', scheduler.ticks),
+            ('ticks.per_second', '%.1f' % self.tick_rate.per_second()),
+            ('ticks.overruns', scheduler.overruns),
+            ('tick_rate', scheduler.tick_rate),
+        ]
+        stats.extend(self.world.stats())
+        stats.extend([
+            ('sql.statements', db.statements),
+            ('sql.per_second', '%.1f' % self.sql_rate.per_second()),
+            ('executor.queued', len(self.reactor.executor)),
+            ('logins.pending', server.pending_logins),
+            ('reaped.auth', server.reaped_auth),
+            ('reaped.idle', server.reaped_idle),
+            ('timers.pending', scheduler.pending_timers()),
+            ('sessions.cached', len(server.sessions)),
+            ('sessions.hits', server.sessions.hits),
+            ('sessions.misses', server.sessions.misses),
+            ('input.active', len(server.active)),
+            ('render.dirty', len(server.dirty)),
+            ('output.queued_bytes', sum(queued)),
+            ('output.queued_max', max(queued) if queued else 0),
+            ('output.backlogged', sum(1 for handler in handlers if handler.transport.backlog())),
+            ('output.frames', server.frames_sent),
+            ('output.dropped_frames', server.dropped_frames),
+            ('output.bytes', server.frame_bytes),
+            ('output.syscalls', server.syscalls),
+            ('process.rss', rss_bytes()),
+            ('reactor.channels', len(self.reactor)),
+        ])
+        lines = ['%-24s %s' % stat for stat in stats]
+        return '\n'.join(lines) + '\n\n' + scheduler.metrics.report()
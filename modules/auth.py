@@ -1,3 +1,103 @@
 from config import *
 
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
 
+HASH_SCHEME = 'pbkdf2_sha256'
+SALT_SIZE = 16
+
+#
+#   Password hashing, pbkdf2 stored as pbkdf2_sha256$iterations$salt$hash,
+#   rows from before hashing hold the plain password
+#
+def hash_password(password, iterations, salt = None):
+    if salt is None:
+        salt = os.urandom(SALT_SIZE)
+    digest = hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+    return '%s$%d$%s$%s' % (HASH_SCHEME, iterations, base64.b64encode(salt), base64.b64encode(digest))
+
+def verify_password(password, stored, iterations):
+    # returns whether the password matches and, if the row is plain text or
+    # hashed with another cost, the hash it should be stored as from now on
+    stored = str(stored)
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != HASH_SCHEME:
+        if not hmac.compare_digest(stored, password):
+            return False, None
+        return True, hash_password(password, iterations)
+    stored_iterations = int(parts[1])
+    expected = hash_password(password, stored_iterations, base64.b64decode(parts[2]))
+    if not hmac.compare_digest(stored, expected):
+        return False, None
+    if stored_iterations != iterations:
+        return True, hash_password(password, iterations)
+    return True, None
+
+def _close_fds(fds):
+    # pool worker start, inherited client sockets must not be kept open here
+    for fd in fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+def _call(func, args):
+    # apply_async has no error callback, errors come back as a result
+    try:
+        return func(*args), None
+    except Exception, e:
+        return None, e
+
+#
+#   Key derivation in worker processes, a login never spends the cpu of the
+#   game loop on it
+#
+class PasswordHasher(object):
+    def __init__(self, workers, iterations, inherited_fds = ()):
+        # create it before the sockets and threads, the workers are forked
+        self.iterations = iterations
+        self._pool = multiprocessing.Pool(workers, _close_fds, (list(inherited_fds),))
+
+    def _submit(self, reactor, func, args, done):
+        def finished(result):
+            reactor.call_soon_threadsafe(done, *result)
+        self._pool.apply_async(_call, (func, args), callback = finished)
+
+    def hash(self, reactor, password, done):
+        # done(hash, error) on the loop
+        self._submit(reactor, hash_password, (password, self.iterations), done)
+
+    def verify(self, reactor, password, stored, done):
+        # done((valid, new hash or None), error) on the loop
+        self._submit(reactor, verify_password, (password, stored, self.iterations), done)
+
+    def close(self):
+        self._pool.terminate()
+
+#
+#   Blocking account work of the login pipeline, runs on the executor and
+#   never touches the world
+#
+def find_user(username):
+    try:
+        return Users.get(Users.username == username)
+    except Users.DoesNotExist:
+        return None
+
+def load_character(user, password = None):
+    if password:
+        # first login after a change of the hashing, store the new hash
+        user.password = password
+        user.save()
+    char = Char.get(Char.user == user)
+    return char, count_items(char)
+
+def create_account(username, password):
+    with db.transaction():
+        user = Users.create(username=username, password=password)
+        #FIXME: get attributs from classes and races
+        char = Char.create(user = user, level=ATTRIBUTES['level'], experience=ATTRIBUTES['experience'], health=ATTRIBUTES['health'], mana=ATTRIBUTES['mana'], strength=ATTRIBUTES['strength'], dexterity=ATTRIBUTES['dexterity'], zonex=ATTRIBUTES['zonex'], zoney=ATTRIBUTES['zoney'])
+    return user, char
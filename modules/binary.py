@@ -0,0 +1,254 @@
+#
+#   binary.py
+#
+#   Compact binary frontend for bots and custom clients on its own port,
+#   the same world and login as telnet without any terminal codes. Every
+#   message is framed by lib/wire.py, integers are big endian.
+#
+#   Server to client:
+#
+#   HELLO      version, zone width, zone height, palette size and the
+#              palette as (tile id, glyph, colour), everything after a
+#              HELLO starts from scratch
+#   TEXT       prompts, errors and info lines as plain text
+#   ZONE       zone x and y (int32), then the terrain row by row as run
+#              length (count, tile id) pairs, drops all entities
+#   ENTITIES   removed count (uint16) and (x, y) pairs, then changed count
+#              (uint16) and (x, y, kind, glyph, colour) records
+#   STATUS     view (1 world, 2 inventory), then health, mana, strength,
+#              dexterity, level, zone x, zone y, x, y as int32
+#   ROSTER     names of the players online, space separated
+#   INVENTORY  selected index (int8), entry count, entries of (index int8,
+#              section, amount, name length, name), then the footer text
+#
+#   Client to server:
+#
+#   KEY        one key as the telnet frontend knows it, w a s d, i, e,
+#              escape sequences for the arrows, ESC to quit
+#   LINE       a line typed at the login prompts
+#
+#   Colours are indexes into COLORS, 0 is the client's default. After
+#   the first frame only what changed is sent.
+#
+from config import *
+from lib.static import *
+from lib.telnet import KEY, ENTER
+from lib.wire import message, run_length, MessageParser, MAX_PAYLOAD
+from modules.render import Info
+from modules.server import GameHandler
+from modules.network import Listener
+from modules.world import TILES, ZONE_WIDTH, ZONE_HEIGHT
+
+import struct
+
+VERSION = 1
+
+# server messages
+HELLO = 1
+TEXT = 2
+ZONE = 3
+ENTITIES = 4
+STATUS = 5
+ROSTER = 6
+INVENTORY = 7
+
+# client messages
+INPUT_KEY = 1
+INPUT_LINE = 2
+
+# entity kinds
+OTHER = 0
+PLAYER = 1
+ENEMY = 2
+ITEM = 3
+
+COLORS = ('', Colors.RED, Colors.REDBOLD, Colors.GREEN, Colors.GREENBOLD, Colors.YELLOW, Colors.YELLOWBOLD, Colors.BLUE, Colors.BLUEBOLD)
+COLOR_INDEX = dict((color, index) for index, color in enumerate(COLORS))
+
+# longest client message, keys and login lines are short
+MAX_INPUT = 64
+
+POSITION = struct.Struct('>BB')
+RECORD = struct.Struct('>BBBcB')
+STATUS_FIELDS = struct.Struct('>B9i')
+
+_glyphs = {}
+# encoded terrain by zone, it never changes
+_terrain = {}
+# entity records by zone and the zone version they were made for
+_entities = {}
+
+def glyph(tile):
+    # (character, colour) of a tile, plain or made by set_color()
+    cached = _glyphs.get(tile)
+    if cached is None:
+        char, color = tile[:1] or ' ', 0
+        if tile.endswith(Colors.RESET) and len(tile) > len(Colors.RESET):
+            body = tile[:-len(Colors.RESET)]
+            char, color = body[-1], COLOR_INDEX.get(body[:-1], 0)
+        # struct's 'c' only takes a byte string
+        cached = _glyphs[tile] = (str(char), color)
+    return cached
+
+def hello():
+    palette = sorted(TILES.items())
+    payload = [struct.pack('>BBBB', VERSION, ZONE_WIDTH, ZONE_HEIGHT, len(palette))]
+    for tile_id, tile in palette:
+        char, color = glyph(tile)
+        payload.append(struct.pack('>BcB', tile_id, char, color))
+    return ''.join(payload)
+
+def terrain(world, zone_x, zone_y):
+    key = (zone_x, zone_y)
+    payload = _terrain.get(key)
+    if payload is None:
+        tiles = ''.join(chr(tile) for tile in world.get_zone(zone_x, zone_y).terrain())
+        payload = _terrain[key] = struct.pack('>ii', zone_x, zone_y) + run_length(tiles)
+    return payload
+
+def entity_kind(entity):
+    basis = type(entity.basis)
+    if basis is User:
+        return PLAYER
+    if basis is Enemy:
+        return ENEMY
+    if basis is Item:
+        return ITEM
+    return OTHER
+
+def entity_records(zone):
+    # {(x, y): record} of a zone, made once per change for every viewer
+    cached = _entities.get(zone)
+    if cached is None or cached[0] != zone.version:
+        records = {}
+        for entity in zone.entities():
+            char, color = glyph(entity.tile)
+            records[(entity.x, entity.y)] = RECORD.pack(entity.x, entity.y, entity_kind(entity), char, color)
+        cached = _entities[zone] = (zone.version, records)
+    return cached[1]
+
+def entity_delta(sent, records):
+    # the ENTITIES payload turning sent into records, None without changes
+    removed = [position for position in sent if position not in records]
+    changed = [record for position, record in records.iteritems() if sent.get(position) != record]
+    if not removed and not changed:
+        return None
+    return ''.join([struct.pack('>H', len(removed))] + [POSITION.pack(*position) for position in removed] + [struct.pack('>H', len(changed))] + changed)
+
+def status(handler):
+    char = handler.user.char
+    entity = handler.entity
+    return STATUS_FIELDS.pack(handler.state, char.health, char.mana, char.strength, char.dexterity, char.level, entity.zone_x, entity.zone_y, entity.x, entity.y)
+
+def inventory(view):
+    entries = []
+    for index, char_item, _ in sorted(view.equipped.values()):
+        name = char_item.item.readname if char_item else ''
+        entries.append((index, ItemSection.EQUIPPED, 1 if char_item else 0, name))
+    for section, items in ((ItemSection.EQUIPMENT, view.equipment), (ItemSection.POTION, view.potion)):
+        for index, char_item, amount in items:
+            entries.append((index, section, amount, char_item.item.readname))
+    payload = [struct.pack('>bB', view.selected_index, len(entries))]
+    for index, section, amount, name in entries:
+        name = str(name)[:255]
+        payload.append(struct.pack('>bBBB', index, section, min(amount, 255), len(name)) + name)
+    payload.append(str(view.footer))
+    return ''.join(payload)
+
+#
+#   Client messages as the key events of the telnet parser
+#
+class InputParser(MessageParser):
+    def feed(self, data):
+        events = []
+        for kind, payload in MessageParser.feed(self, data):
+            if kind == INPUT_KEY and payload:
+                events.append((KEY, payload))
+            elif kind == INPUT_LINE:
+                events.extend((KEY, c) for c in payload)
+                events.append((KEY, ENTER))
+        return events
+
+    def escape_pending(self):
+        return False
+
+class BinaryHandler(GameHandler):
+    protocol = 'binary'
+
+    def __init__(self, address, world, server):
+        GameHandler.__init__(self, address, world, server)
+        self.parser = InputParser(MAX_INPUT)
+        self.reset()
+
+    def reset(self):
+        # what the client got last, the next frame is the difference
+        self.sent_zone = None
+        self.sent_entities = {}
+        self.sent_status = None
+        self.sent_roster = None
+        self.sent_inventory = None
+
+    def resync(self):
+        self.reset()
+
+    def negotiate(self):
+        self.reset()
+        self.send_message(HELLO, hello())
+
+    def set_char_mode(self, mode = True):
+        # no terminal to switch
+        pass
+
+    def data_received(self, data):
+        try:
+            GameHandler.data_received(self, data)
+        except ValueError, e:
+            print '%s: %s' % (self.address[0], e)
+            self.handle_close()
+
+    def send_data(self, data, frame = False):
+        # text from the login and game code shared with telnet
+        self.send_message(TEXT, data, frame)
+
+    def send_message(self, kind, payload, frame = False):
+        GameHandler.send_data(self, message(kind, payload), frame)
+
+    def send_state(self, roster):
+        # render phase, roster is the space separated player list
+        self.drop_backlog()
+        if roster != self.sent_roster:
+            self.sent_roster = roster
+            self.send_message(ROSTER, roster[:MAX_PAYLOAD], True)
+        current = status(self)
+        if current != self.sent_status:
+            self.sent_status = current
+            self.send_message(STATUS, current, True)
+        if self.state == States.WORLD:
+            zone = self.world.get_zone(self.entity.zone_x, self.entity.zone_y)
+            if zone is not self.sent_zone:
+                self.sent_zone = zone
+                self.sent_entities = {}
+                self.send_message(ZONE, terrain(self.world, self.entity.zone_x, self.entity.zone_y), True)
+            records = entity_records(zone)
+            delta = entity_delta(self.sent_entities, records)
+            if delta:
+                self.send_message(ENTITIES, delta, True)
+            self.sent_entities = records
+            info = Info.write(self.user)
+            if info:
+                self.send_message(TEXT, info, True)
+        elif self.state == States.INVENTORY:
+            self.inventory.write(self.user)
+            current = inventory(self.inventory)
+            if current != self.sent_inventory:
+                self.sent_inventory = current
+                self.send_message(INVENTORY, current, True)
+
+class BinaryServer(Listener):
+    def __init__(self, host, port, server, sock = None):
+        Listener.__init__(self, server.reactor, host, port, LISTEN_BACKLOG, sock)
+        self.server = server
+        server.handlers[BinaryHandler.protocol] = BinaryHandler
+
+    def handle_accept(self, sock, addr):
+        self.server.accept(sock, addr, BinaryHandler)
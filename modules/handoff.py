@@ -0,0 +1,129 @@
+#
+#   handoff.py
+#
+#   Hot restart, the running server hands its listening and client sockets
+#   together with the session state over to a freshly started process.
+#
+#   Python 2 has no sendmsg for SCM_RIGHTS, so the new process is forked
+#   and exec'd with exactly the sockets it takes over left open, the state
+#   goes along in an unlinked temporary file. The old process waits until
+#   the new one reports ready and resumes on its own if it never does.
+#   The new process gets a new pid, a supervisor has to follow the fork.
+#
+import base64
+import errno
+import fcntl
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import tempfile
+
+HANDOFF_ENV = 'TA_HANDOFF'
+
+_ready_fd = None
+
+def encode(data):
+    return base64.b64encode(data)
+
+def decode(data):
+    return base64.b64decode(data)
+
+def _open_fds():
+    try:
+        return [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        return range(3, os.sysconf('SC_OPEN_MAX'))
+
+def _exec(state_fd, ready_fd, keep):
+    # runs in the forked child, never returns
+    try:
+        keep = set(keep) | set((0, 1, 2, state_fd, ready_fd))
+        for fd in _open_fds():
+            try:
+                if fd in keep:
+                    # tempfile sets close on exec
+                    fcntl.fcntl(fd, fcntl.F_SETFD, 0)
+                else:
+                    os.close(fd)
+            except (IOError, OSError):
+                pass
+        env = dict(os.environ)
+        env[HANDOFF_ENV] = '%d,%d' % (state_fd, ready_fd)
+        os.execve(sys.executable, [sys.executable] + sys.argv, env)
+    finally:
+        os._exit(1)
+
+def spawn(state, fds, timeout):
+    # starts the new process, returns True once it took over
+    state_file = tempfile.TemporaryFile()
+    json.dump(state, state_file)
+    state_file.flush()
+    state_file.seek(0)
+    ready_read, ready_write = os.pipe()
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        _exec(state_file.fileno(), ready_write, fds)
+    state_file.close()
+    os.close(ready_write)
+    taken = False
+    try:
+        while True:
+            try:
+                readable, _, _ = select.select([ready_read], [], [], timeout)
+                break
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+        taken = bool(readable and os.read(ready_read, 1))
+    finally:
+        os.close(ready_read)
+        if not taken:
+            # crashed, hanging or given up on, it must not touch the
+            # sockets any more
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+            os.waitpid(pid, 0)
+    return taken
+
+def receive():
+    # the handed over state in the new process, None on a normal start
+    global _ready_fd
+    fds = os.environ.pop(HANDOFF_ENV, None)
+    if not fds:
+        return None
+    state_fd, _ready_fd = [int(fd) for fd in fds.split(',')]
+    with os.fdopen(state_fd) as state_file:
+        return json.load(state_file)
+
+def inherited(state):
+    # descriptors the previous process left open for this one
+    if state is None:
+        return []
+    # a process from before the binary port hands over none
+    fds = [fd for fd in (state['game'], state['admin'], state.get('binary')) if fd is not None]
+    fds.extend(session['fd'] for session in state['sessions'])
+    if _ready_fd is not None:
+        fds.append(_ready_fd)
+    return fds
+
+def ready():
+    # tells the old process to go
+    global _ready_fd
+    if _ready_fd is not None:
+        os.write(_ready_fd, 'r')
+        os.close(_ready_fd)
+        _ready_fd = None
+
+def take_socket(fd):
+    # socket object for an inherited descriptor
+    if fd is None:
+        return None
+    sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+    os.close(fd)
+    return sock
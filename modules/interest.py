@@ -0,0 +1,42 @@
+#
+#   interest.py
+#
+
+#
+#   Area of interest, which handlers look at which zone
+#
+class InterestManager(object):
+    def __init__(self):
+        self._subscribers = {}
+        self._zones = {}
+
+    def __len__(self):
+        # handlers subscribed to some zone
+        return len(self._zones)
+
+    def subscribe(self, handler, zone_x, zone_y):
+        zone = (zone_x, zone_y)
+        current = self._zones.get(handler)
+        if current == zone:
+            return
+        if current is not None:
+            self.unsubscribe(handler)
+        self._zones[handler] = zone
+        self._subscribers.setdefault(zone, set()).add(handler)
+
+    def unsubscribe(self, handler):
+        zone = self._zones.pop(handler, None)
+        if zone is None:
+            return
+        subscribers = self._subscribers[zone]
+        subscribers.discard(handler)
+        if not subscribers:
+            del self._subscribers[zone]
+
+    def follow(self, handler):
+        # keeps the subscription in step with the handler's entity
+        if handler.entity:
+            self.subscribe(handler, handler.entity.zone_x, handler.entity.zone_y)
+
+    def subscribers(self, zone_x, zone_y):
+        return self._subscribers.get((zone_x, zone_y), ())
@@ -0,0 +1,349 @@
+#
+#   network.py
+#
+import collections
+import errno
+import socket
+import time
+import zlib
+from lib.selector import DefaultSelector, EVENT_READ, EVENT_WRITE
+from lib.workers import WorkerPool
+
+BUFFER_SIZE = 8192
+# connections taken from the accept queue per readiness event
+ACCEPT_BURST = 64
+
+# output kinds, frames may be dropped in favour of a newer one
+CONTROL, FRAME, COMPRESS = range(3)
+# bytes a client may fall behind before it counts as dead
+OUTPUT_LIMIT = 256 * 1024
+
+WOULDBLOCK = frozenset((errno.EAGAIN, errno.EWOULDBLOCK))
+DISCONNECTED = frozenset((errno.ECONNRESET, errno.ENOTCONN, errno.ESHUTDOWN, errno.ECONNABORTED, errno.EPIPE, errno.EBADF, errno.ETIMEDOUT, errno.ECONNREFUSED))
+
+def raise_fd_limit():
+    # every client costs a file descriptor, use all the kernel allows
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or hard > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+    except (ImportError, ValueError, OSError), e:
+        print e
+
+#
+#   Event dispatcher, keeps the registry of open channels by file descriptor
+#
+class Reactor(object):
+    def __init__(self, workers = 1):
+        self.selector = DefaultSelector()
+        self.executor = WorkerPool(workers)
+        self._callbacks = collections.deque()
+        self._waker = Waker(self)
+        # time the last poll spent handling events, without the wait
+        self.dispatch_time = 0.0
+
+    def __len__(self):
+        return len(self.selector)
+
+    def call_soon_threadsafe(self, callback, *args):
+        self._callbacks.append((callback, args))
+        self._waker.wake()
+
+    def run_in_executor(self, func, args, callback):
+        # func(*args) runs on a worker thread, callback(result, error) on the loop
+        def done(result, error):
+            self.call_soon_threadsafe(callback, result, error)
+        self.executor.submit(func, args, done)
+
+    def _run_callbacks(self):
+        for _ in xrange(len(self._callbacks)):
+            callback, args = self._callbacks.popleft()
+            callback(*args)
+
+    def register(self, channel, events):
+        self.selector.register(channel.fileno(), events, channel)
+
+    def modify(self, channel, events):
+        self.selector.modify(channel.fileno(), events)
+
+    def unregister(self, channel):
+        self.selector.unregister(channel.fileno())
+
+    def poll(self, timeout = None):
+        ready = self.selector.select(timeout)
+        started = time.time()
+        for channel, events in ready:
+            if events & EVENT_READ and not channel.closed:
+                channel.handle_read_event()
+            if events & EVENT_WRITE and not channel.closed:
+                channel.handle_write_event()
+        self._run_callbacks()
+        self.dispatch_time = time.time() - started
+
+class Channel(object):
+    def __init__(self, reactor, sock, events = EVENT_READ):
+        self.reactor = reactor
+        self.socket = sock
+        self.socket.setblocking(0)
+        self.closed = False
+        self._fileno = sock.fileno()
+        self._events = events
+        reactor.register(self, events)
+
+    def fileno(self):
+        return self._fileno
+
+    def set_events(self, events):
+        if events != self._events and not self.closed:
+            self._events = events
+            self.reactor.modify(self, events)
+
+    def handle_read_event(self):
+        pass
+
+    def handle_write_event(self):
+        pass
+
+    def detach(self):
+        # stops the events for the socket but leaves it open, for a hot restart
+        self.reactor.unregister(self)
+
+    def attach(self):
+        self._events = EVENT_READ
+        self.reactor.register(self, EVENT_READ)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.reactor.unregister(self)
+            try:
+                self.socket.close()
+            except socket.error:
+                pass
+
+#
+#   Self pipe, lets worker threads interrupt a sleeping poll
+#
+class Waker(Channel):
+    def __init__(self, reactor):
+        self._writer, reader = socket.socketpair()
+        self._writer.setblocking(0)
+        self._signalled = False
+        Channel.__init__(self, reactor, reader)
+
+    def wake(self):
+        if not self._signalled:
+            self._signalled = True
+            try:
+                self._writer.send('x')
+            except socket.error:
+                pass
+
+    def handle_read_event(self):
+        self._signalled = False
+        try:
+            self.socket.recv(BUFFER_SIZE)
+        except socket.error:
+            pass
+
+#
+#   Listening socket, accepts until the queue is drained
+#
+class Listener(Channel):
+    def __init__(self, reactor, host, port, backlog, sock = None):
+        # sock is an already listening socket, one inherited on a hot restart
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+            sock.listen(backlog)
+        Channel.__init__(self, reactor, sock)
+
+    def handle_read_event(self):
+        for _ in xrange(ACCEPT_BURST):
+            try:
+                sock, addr = self.socket.accept()
+            except socket.error, e:
+                if e.args[0] in WOULDBLOCK or e.args[0] == errno.ECONNABORTED:
+                    return
+                if e.args[0] in (errno.EMFILE, errno.ENFILE):
+                    print 'Out of file descriptors, %d open connections' % len(self.reactor)
+                    return
+                raise
+            sock.setblocking(0)
+            self.handle_accept(sock, addr)
+
+    def handle_accept(self, sock, addr):
+        sock.close()
+
+#
+#   Protocol interface, the game side of a connection
+#
+class Protocol(object):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        pass
+
+    def connection_lost(self, error):
+        pass
+
+#
+#   Stream connection with a bounded output queue
+#
+#   Output is queued as whole entries, the head entry is committed to the
+#   socket and sent from an offset so a partial send never copies. Entries
+#   behind the head are still uncommitted, frames among them can be dropped
+#   when a newer frame supersedes them. Write interest is only armed while
+#   the socket refuses data.
+#
+class Transport(Channel):
+    def __init__(self, reactor, sock, protocol, limit = OUTPUT_LIMIT):
+        Channel.__init__(self, reactor, sock)
+        try:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except socket.error:
+            # not a tcp socket
+            pass
+        self.limit = limit
+        self._queue = collections.deque()
+        self._head = ''
+        self._offset = 0
+        self._compress_level = None
+        self._closing = False
+        self.compressor = None
+        self.queued_bytes = 0
+        self.syscalls = 0
+        self.bytes_sent = 0
+        self.dropped_frames = 0
+        self.protocol = protocol
+        protocol.connection_made(self)
+
+    def backlog(self):
+        # entries waiting behind the one on the wire
+        return len(self._queue)
+
+    def write(self, data, kind = CONTROL):
+        if self.closed or not data:
+            return
+        if isinstance(data, unicode):
+            # buffer() would expose the internal representation, and the
+            # offsets count bytes
+            data = data.encode('utf-8')
+        self._queue.append((data, kind))
+        self.queued_bytes += len(data)
+        if self.queued_bytes + len(self._head) - self._offset > self.limit:
+            # the client stopped reading
+            self.close()
+            return
+        if not self._head:
+            self.initiate_send()
+
+    def close_when_done(self):
+        # close once everything queued is on the wire
+        self._closing = True
+        if not self._head and not self._queue:
+            self.close()
+
+    def start_compression(self, marker, level):
+        # the marker goes out as is, everything behind it through zlib
+        self._compress_level = level
+        self.write(marker, COMPRESS)
+
+    def drop_frames(self):
+        queue = collections.deque()
+        dropped = 0
+        for data, kind in self._queue:
+            if kind == FRAME:
+                self.queued_bytes -= len(data)
+                dropped += 1
+            else:
+                queue.append((data, kind))
+        self._queue = queue
+        self.dropped_frames += dropped
+        return dropped
+
+    def detach(self):
+        # returns the output not sent yet, a compressed stream is finished
+        # so whoever takes the socket over continues uncompressed
+        pending = [self._head[self._offset:]]
+        while self._queue:
+            self._commit()
+            pending.append(self._head)
+        if self.compressor:
+            pending.append(self.compressor.flush(zlib.Z_FINISH))
+            self.compressor = None
+        self._head = ''
+        self._offset = 0
+        Channel.detach(self)
+        return ''.join(pending)
+
+    def attach(self, pending = ''):
+        Channel.attach(self)
+        self.write(pending)
+
+    def _commit(self):
+        data, kind = self._queue.popleft()
+        self.queued_bytes -= len(data)
+        if kind == COMPRESS:
+            self.compressor = zlib.compressobj(self._compress_level)
+        elif self.compressor:
+            # sync flush, the client can display the entry right away
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._head = data
+        self._offset = 0
+
+    def initiate_send(self):
+        while True:
+            if not self._head:
+                if not self._queue:
+                    if self._closing:
+                        self.close()
+                        return
+                    self.set_events(EVENT_READ)
+                    return
+                self._commit()
+            self.syscalls += 1
+            try:
+                num_sent = self.socket.send(buffer(self._head, self._offset))
+            except socket.error, e:
+                if e.args[0] in WOULDBLOCK:
+                    num_sent = 0
+                elif e.args[0] in DISCONNECTED:
+                    self.close(e)
+                    return
+                else:
+                    raise
+            self.bytes_sent += num_sent
+            self._offset += num_sent
+            if self._offset < len(self._head):
+                self.set_events(EVENT_READ | EVENT_WRITE)
+                return
+            self._head = ''
+
+    def handle_read_event(self):
+        try:
+            data = self.socket.recv(BUFFER_SIZE)
+        except socket.error, e:
+            if e.args[0] in WOULDBLOCK:
+                return
+            if e.args[0] in DISCONNECTED:
+                self.close(e)
+                return
+            raise
+        if data:
+            self.protocol.data_received(data)
+        else:
+            self.close()
+
+    def handle_write_event(self):
+        self.initiate_send()
+
+    def close(self, error = None):
+        if not self.closed:
+            Channel.close(self)
+            self._queue.clear()
+            self._head = ''
+            self.protocol.connection_lost(error)
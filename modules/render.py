@@ -50,13 +50,8 @@ class Error(RenderBase):
 
 class OnlineUsers(RenderBase):
     @staticmethod
-    def write(handlers):
-        users = []
-        for handler in handlers:
-            if handler.username and handler.state and not handler.shutdown:
-                users.append(handler.username)
-        users.sort()
-        return 'Online Users: ' + ' '.join(users) + LINE
+    def write(names):
+        return 'Online Users: ' + names + LINE
 
 class Character(RenderBase):
     @staticmethod
@@ -80,47 +75,60 @@ class Inventory(RenderBase):
         self.data = None
         self.item_count = 0
         self.info_text = None
+        self.footer = ''
+        # rows of the view as (index, text, selected text), the items are
+        # loaded again only after they changed
+        self._rows = []
+        self.stale = True
 
     def fetch_item_count(self, user):
         self.item_count = user.items_amount()
 
-    def __render_items(self):
-        self.data = '\nCharacter:\n'
-        for _, e in self.equipped.items():
-            if e[0] == self.selected_index:
-                self.data += e[2] % (set_background_text('%s\n' % (e[1].item.readname,) if e[1] else 'None\n', BgColors.RED),)
+    def invalidate(self):
+        self.stale = True
+
+    def load(self, user):
+        # the whole inventory in three queries
+        amounts = user.item_amounts()
+        equipped = user.get_equipped_items()
+        equipment = []
+        potion = []
+        for char_item in user.get_items_by_categories([0, 1, 2, 3]):
+            if char_item.item.category == 3:
+                potion.append(char_item)
             else:
-                self.data += e[2] % ('%s\n' % (e[1].item.readname,) if e[1] else 'None\n',)
-        self.data += '\nEquipment:\n'
-        #items = []
-        #item_break = 0
-        if not self.equipment:
-            self.data += 'None\n'
-        else:
-            for e in self.equipment:
-                '''
-                item_break += len(e[1].item.readname) + 5
-                if item_break > 40:
-                    item_break_symbol = '\n'
-                else:
-                    item_break_symbol = ''
-                '''
-                if e[0] == self.selected_index:
-                    self.data += set_background_text('%sx %s\n' % (str(e[2]), e[1].item.readname), BgColors.RED)
-                else:
-                    self.data += '%sx %s\n' % (str(e[2]), e[1].item.readname)
-            #self.data += ', '.join(items)
-        self.data += '\nPotions:\n'
-        #items = []
-        if not self.potion:
-            self.data += 'None\n'
-        else:
-            for e in self.potion:
-                if e[0] == self.selected_index:
-                    self.data += set_background_text('%sx %s\n' % (str(e[2]), e[1].item.readname), BgColors.RED)
-                else:
-                    self.data += '%sx %s\n' % (str(e[2]), e[1].item.readname)
-            #self.data += ', '.join(items)
+                equipment.append(char_item)
+        self.equipment = [(index, char_item, amounts.get(char_item.item.id, 0)) for index, char_item in enumerate(equipment)]
+        self.potion = [(index, char_item, amounts.get(char_item.item.id, 0)) for index, char_item in enumerate(potion, len(equipment))]
+
+        self.item_count = len(self.equipment) + len(self.potion)
+
+        self.equipped = {}
+        self.equipped['armor'] = (-3, equipped.get(1), '   O\t Armor: %s')
+        self.equipped['weapon'] = (-2, equipped.get(0), ' /=Y=\ \t Weapon: %s')
+        self.equipped['jewelry'] = (-1, equipped.get(2), '  / \ \t Jewelry: %s')
+
+        self.__build_rows()
+        self.stale = False
+
+    def __build_rows(self):
+        rows = [(None, '\nCharacter:\n', None)]
+        for _, e in self.equipped.items():
+            name = '%s\n' % (str(e[1].item.readname),) if e[1] else 'None\n'
+            rows.append((e[0], e[2] % (name,), e[2] % (set_background_text(name, BgColors.RED),)))
+        for title, entries in (('\nEquipment:\n', self.equipment), ('\nPotions:\n', self.potion)):
+            rows.append((None, title, None))
+            if not entries:
+                rows.append((None, 'None\n', None))
+            for e in entries:
+                text = '%sx %s\n' % (str(e[2]), str(e[1].item.readname))
+                rows.append((e[0], text, set_background_text(text, BgColors.RED)))
+        self._rows = rows
+
+    def __render_items(self):
+        # only the highlight moves with the selection
+        selected = self.selected_index
+        self.data = ''.join(marked if index == selected else text for index, text, marked in self._rows)
 
     def get_selected_charitem(self):
 
@@ -140,31 +148,23 @@ class Inventory(RenderBase):
         return (None, None)
 
     def write(self, user):
-        self.equipment = []
-        self.potion = []
-        self.equipped = {}
-        for index, char_item in enumerate(user.get_items_by_categories([0, 1, 2])):
-            self.equipment.append((index, char_item, user.item_amount(char_item)))
-        for index, char_item in enumerate(user.get_items_by_categories([3]), len(self.equipment)):
-            self.potion.append((index, char_item, user.item_amount(char_item)))
-
-        self.item_count = len(self.equipment) + len(self.potion)
-
-        self.equipped['armor'] = (-3, user.get_equipped_item_by_category(1), '   O\t Armor: %s')
-        self.equipped['weapon'] = (-2, user.get_equipped_item_by_category(0), ' /=Y=\ \t Weapon: %s')
-        self.equipped['jewelry'] = (-1, user.get_equipped_item_by_category(2), '  / \ \t Jewelry: %s')
-
+        if self.stale:
+            self.load(user)
         self.__render_items()
         len_equipment = len(self.equipment) if len(self.equipment) else 1
         len_potion = len(self.potion) if len(self.potion) else 1
         line_breaks = (9-(len_equipment+len_potion))*'\n'
+        # the info text or the attributes of the selected item
+        self.footer = ''
         if self.info_text:
-            self.data += '%s%s' % (line_breaks, self.info_text)
+            self.footer = self.info_text
             self.info_text = None
         else:
             _, selected_charitem = self.get_selected_charitem()
             if selected_charitem:
-                self.data += '%sL:%s, C:%s, H:%s, M:%s, S:%s, D:%s' % (line_breaks, selected_charitem.item.level, selected_charitem.item.condition, selected_charitem.item.health, selected_charitem.item.mana, selected_charitem.item.strength, selected_charitem.item.dexterity)
+                self.footer = 'L:%s, C:%s, H:%s, M:%s, S:%s, D:%s' % (selected_charitem.item.level, selected_charitem.item.condition, selected_charitem.item.health, selected_charitem.item.mana, selected_charitem.item.strength, selected_charitem.item.dexterity)
+        if self.footer:
+            self.data += line_breaks + self.footer
 
         return self.data
 
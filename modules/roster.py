@@ -0,0 +1,53 @@
+#
+#   roster.py
+#
+import bisect
+
+#
+#   Sorted names of the players in the world, kept up to date on login and
+#   logout, the texts made from it are built once per change
+#
+class Roster(object):
+    def __init__(self, width):
+        self.width = width
+        self._names = []
+        self._text = None
+        self._line = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        bisect.insort(self._names, name)
+        self._text = self._line = None
+
+    def remove(self, name):
+        index = bisect.bisect_left(self._names, name)
+        if index < len(self._names) and self._names[index] == name:
+            del self._names[index]
+            self._text = self._line = None
+
+    def text(self):
+        # every name, space separated
+        if self._text is None:
+            self._text = ' '.join(self._names)
+        return self._text
+
+    def line(self):
+        # the names fitting into width, the others only counted
+        if self._line is None:
+            line = self.text()
+            if len(line) > self.width:
+                names = self._names
+                more = ' (+%d more)'
+                room = self.width - len(more % len(names))
+                shown = []
+                used = 0
+                for name in names:
+                    if used + len(name) > room:
+                        break
+                    shown.append(name)
+                    used += len(name) + 1
+                line = ' '.join(shown) + more % (len(names) - len(shown))
+            self._line = line
+        return self._line
@@ -0,0 +1,94 @@
+#
+#   scheduler.py
+#
+import time
+from lib.metrics import Metrics
+from lib.timerwheel import TimerWheel
+
+#
+#   Fixed timestep game loop
+#
+#   Every pass waits in the reactor until either a socket becomes ready, the
+#   next timer is due or, if a tick was requested, the next tick boundary is
+#   reached. A tick runs the simulate, render and flush phases in order and
+#   only happens when something woke the scheduler, so an idle server sleeps
+#   in epoll and a busy one gets one tick per tick length.
+#
+#   Every tick records the time of its phases in the metrics registry, the
+#   input phase being the event handling since the previous tick.
+#
+class Scheduler(object):
+    def __init__(self, tick_rate, reactor, timer_resolution):
+        self.reactor = reactor
+        self.tick_rate = tick_rate
+        self.tick_length = 1.0 / tick_rate
+        self.ticks = 0
+        self.overruns = 0
+        # per connection timers come by the thousand, a wheel keeps them O(1)
+        self._timers = TimerWheel(timer_resolution, time.time())
+        self._pending = False
+        self._next_tick = time.time()
+        self._running = False
+        self._input_time = 0.0
+        self.metrics = Metrics()
+
+    def wake(self):
+        # request a tick at the next tick boundary
+        self._pending = True
+
+    def call_later(self, delay, callback, *args):
+        return self._timers.schedule(time.time() + delay, callback, *args)
+
+    def cancel(self, timer):
+        if timer:
+            self._timers.cancel(timer)
+
+    def pending_timers(self):
+        return len(self._timers)
+
+    def _timeout(self, now):
+        deadline = self._timers.next_deadline()
+        if self._pending and (deadline is None or self._next_tick < deadline):
+            deadline = self._next_tick
+        if deadline is None:
+            return None
+        return max(0.0, deadline - now)
+
+    def stop(self):
+        self._running = False
+
+    def run(self, simulate, render, flush):
+        self._running = True
+        while self._running:
+            # input phase
+            self.reactor.poll(self._timeout(time.time()))
+            now = time.time()
+            self._timers.advance(now)
+            self._input_time += self.reactor.dispatch_time + time.time() - now
+            if not self._pending or now < self._next_tick:
+                continue
+            if now - self._next_tick > self.tick_length:
+                # first tick after an idle period
+                self._next_tick = now
+            self._pending = False
+            started = time.time()
+            simulate()
+            simulated = time.time()
+            render()
+            rendered = time.time()
+            flush()
+            finished = time.time()
+            self.ticks += 1
+            self._next_tick += self.tick_length
+            metrics = self.metrics
+            metrics.record('tick.input', self._input_time)
+            metrics.record('tick.simulate', simulated - started)
+            metrics.record('tick.render', rendered - simulated)
+            metrics.record('tick.flush', finished - rendered)
+            metrics.record('tick.total', finished - started)
+            self._input_time = 0.0
+            if finished - now > self.tick_length:
+                self.overruns += 1
+            if finished > self._next_tick:
+                # behind schedule, don't try to catch up with a burst of ticks
+                self._next_tick = finished
@@ -1,19 +1,29 @@
 from modules.render import Header, Auth, Welcome, Inventory
 from config import *
 from lib.static import *
+from lib.screen import FrameBuffer, terminal_profile
+from lib.telnet import TelnetParser, KEY, COMMAND, WINDOW_SIZE, TERMINAL_TYPE, ENTER, BACKSPACE, WILL, DO, COMPRESS2, NAWS, TTYPE, SEND, command, subnegotiation
+from modules.network import Protocol, Transport, Listener, CONTROL, FRAME
+from modules.interest import InterestManager
+from modules.handoff import encode, decode, take_socket
+from modules.auth import find_user, load_character, create_account
+from modules.session import Session, SessionCache
+from modules.roster import Roster
 
-import asyncore
-import socket
+import collections
 import time
 
-BUFFER_SIZE = 8192
-CONNECTION_SIZE = 5
+REFRESH_INTERVAL = 60
+# seconds to wait for the rest of an escape sequence before ESC counts as a key
+ESCAPE_TIMEOUT = 0.3
+MAX_LINE_LENGTH = 64
 
-class GameHandler(asyncore.dispatcher_with_send):
-    def __init__(self, (connection, address), world, server):
-        asyncore.dispatcher_with_send.__init__(self, connection)
+class GameHandler(Protocol):
+    # frontend name, handed over on a hot restart
+    protocol = 'telnet'
+
+    def __init__(self, address, world, server):
         self.__address = address
-        self.__last_called = float()
         self.server = server
         self.user = None
         self.userobject = None
@@ -25,176 +35,604 @@ class GameHandler(asyncore.dispatcher_with_send):
         self.authstep = 0
         self.world = world
         self.entity = None
-        self.send(Welcome.write(address))
-        self.send(Auth.username())
-        self.last_time = time.time()
+        self.frame = []
         self.inventory = Inventory()
+        self.screen = FrameBuffer()
+        # parsed rows of the last frame sections, header, roster, status line and body
+        self.frame_parts = None
+        self.parser = TelnetParser()
+        self.input_queue = collections.deque()
+        self.input_tokens = INPUT_BURST
+        self.input_time = time.time()
+        self.dropped_keys = 0
+        # arrival of the oldest key not yet answered by a flush
+        self.input_received = None
+        self.line = ''
+        self.window_size = None
+        self.terminal_type = None
+        # cached session of the user logging in
+        self.session = None
+        # login pending, set while account work for this connection runs on
+        # the executor, input waits meanwhile
+        self.pending = False
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frame_bytes = 0
+        self.frame_syscalls = 0
+        # set once the client agreed to mccp2
+        self.compressed = False
+        # whether everything queued this tick is frame data
+        self.frame_only = True
+        self.refresh_timer = None
+        # login and idle timeouts, checked against the last input when due
+        self.idle_timer = None
+        self.connected = time.time()
+        self.last_input = self.connected
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.refresh_timer = self.server.scheduler.call_later(REFRESH_INTERVAL, self.refresh)
+        self.idle_timer = self.server.scheduler.call_later(AUTH_TIMEOUT if self.state == States.AUTH else IDLE_TIMEOUT, self.check_idle)
+        self.negotiate()
+        if self.state == States.AUTH:
+            self.send_data(Welcome.write(self.__address))
+            self.send_data(Auth.username())
+        else:
+            # taken over from the previous process
+            self.server.login(self)
+            self.server.redraw(self)
+            if self.input_queue:
+                self.server.activate(self)
+        self.server.scheduler.wake()
+
+    def negotiate(self):
+        if MCCP_ENABLED:
+            self.send_data(command(WILL, COMPRESS2))
+        # window size and terminal type pick what the screen sends
+        self.send_data(command(DO, NAWS))
+        self.send_data(command(DO, TTYPE))
 
-    def tick(self):
-        current_time = time.time()
-        delta = current_time - self.last_time
-        #NOTE: current one second, make it more granular
-        if delta > 60:
-            self.run = True
-            self.last_time = current_time
+    @property
+    def address(self):
+        return self.__address
 
+    def refresh(self):
+        self.server.redraw(self)
+        self.server.scheduler.wake()
+        self.refresh_timer = self.server.scheduler.call_later(REFRESH_INTERVAL, self.refresh)
+
+    def check_idle(self):
+        now = time.time()
+        if self.state == States.AUTH:
+            self.reap('login timed out')
+            self.server.reaped_auth += 1
+            return
+        idle = now - self.last_input
+        if idle >= IDLE_TIMEOUT:
+            self.reap('idle for too long')
+            self.server.reaped_idle += 1
+            return
+        self.idle_timer = self.server.scheduler.call_later(IDLE_TIMEOUT - idle, self.check_idle)
+
+    def reap(self, reason):
+        # tells the client why and closes, a dead peer just loses the message
+        self.send_data(Auth.error(reason))
+        self.flush()
+        self.handle_close()
 
     def set_char_mode(self, mode=True):
         if mode:
             # iac wont linemode
-            self.send("\377\375\042")
+            self.send_data("\377\375\042")
             # iac will suppress-goahead
-            self.send("\377\373\3")
+            self.send_data("\377\373\3")
             # iac do suppress-goahead
-            self.send("\377\375\3")
+            self.send_data("\377\375\3")
         else:
             # iac will linemode
-            self.send("\377\373\042")
+            self.send_data("\377\373\042")
             # iac wont suppress-goahead
-            self.send("\377\375\3")
+            self.send_data("\377\375\3")
             # iac dont suppress-goahead
-            self.send("\377\376\3")
-
-    def handle_read(self):
-        data = self.recv(BUFFER_SIZE)
-        if data:
-            datastrip = data.strip()
-            if self.state == States.AUTH:
-                if check_ascii(datastrip) and len(datastrip) <= 8:
-                    if self.authstep == 0:
-                        try:
-                            self.userobject = Users.get(Users.username == datastrip)
-                            self.username = self.userobject.username
-                            self.password = self.userobject.password
-                            self.send(Auth.password())
-                        except:
-                            self.username = datastrip
-                            self.send(Auth.newpassword())
-                        self.authstep = 1
-                    elif self.authstep == 1:
-                        if self.password and self.password == datastrip:
-                            char = Char.get(Char.user == self.userobject)
-                            self.state = States.WORLD
-                            self.set_char_mode(True)
-                            px, py = self.world.get_zone(char.zonex, char.zoney).find_free_place()
-                            self.entity = self.world.add_entity(char.zonex, char.zoney, px, py, set_color("@", Colors.YELLOWBOLD)) # player entity
-                            self.world.get_zone(char.zonex, char.zoney).set_entity(self.entity)
-                            self.user = User(self.username, self.entity, char, self.inventory)
-                            self.inventory.fetch_item_count(self.user)
-                            self.entity.basis = self.user
-                        elif self.password and self.password <> datastrip:
-                            self.authstep = 0
-                            self.password = None
-                            self.send(Auth.error('wrong password'))
-                            self.send(Auth.username())
+            self.send_data("\377\376\3")
+
+    def data_received(self, data):
+        self.last_input = time.time()
+        # game logic runs in the simulate phase of the next tick
+        self.handle_events(self.parser.feed(data))
+        if self.parser.escape_pending():
+            self.server.scheduler.call_later(ESCAPE_TIMEOUT, self.flush_escape)
+
+    def flush_escape(self):
+        if not self.shutdown:
+            self.handle_events(self.parser.flush())
+
+    def handle_events(self, events):
+        for event, value in events:
+            if event == KEY:
+                self.queue_key(value)
+            elif event == WINDOW_SIZE:
+                self.window_size = value
+                self.configure_screen()
+            elif event == TERMINAL_TYPE:
+                self.terminal_type = value
+                self.configure_screen()
+            elif event == COMMAND:
+                self.handle_command(*value)
+        if self.input_queue:
+            self.server.activate(self)
+        elif self.frame:
+            # replies to the negotiation go out with the next flush
+            self.server.scheduler.wake()
+
+    def handle_command(self, cmd, option):
+        if option == COMPRESS2 and MCCP_ENABLED:
+            if cmd == DO and not self.compressed:
+                self.start_compression()
+        elif option == TTYPE and cmd == WILL:
+            # only the first name, clients cycling through theirs start
+            # with the one they prefer
+            self.send_data(subnegotiation(TTYPE, SEND))
+
+    def configure_screen(self):
+        # a change of colors or size repaints the whole screen
+        if self.screen.configure(terminal_profile(self.terminal_type), self.window_size):
+            self.server.redraw(self)
+            self.server.scheduler.wake()
+
+    def start_compression(self):
+        # everything queued so far and the start marker go out uncompressed
+        self.flush()
+        self.transport.start_compression(subnegotiation(COMPRESS2, ''), MCCP_LEVEL)
+        self.compressed = True
+
+    def queue_key(self, key):
+        if self.input_received is None:
+            self.input_received = time.time()
+        queue = self.input_queue
+        if len(queue) >= INPUT_QUEUE_SIZE:
+            self.dropped_keys += 1
+            return
+        if self.state != States.AUTH and len(queue) >= INPUT_REPEAT:
+            # coalesce key repeat, holding a key down must not pile up moves
+            for i in xrange(1, INPUT_REPEAT + 1):
+                if queue[-i] != key:
+                    break
+            else:
+                self.dropped_keys += 1
+                return
+        queue.append(key)
+
+    def update(self):
+        # applies queued keys as far as the rate limit allows, returns True
+        # if input is left for the next tick
+        now = time.time()
+        self.input_tokens = min(INPUT_BURST, self.input_tokens + (now - self.input_time) * INPUT_RATE)
+        self.input_time = now
+        while self.input_queue and not self.pending and not self.shutdown:
+            if self.state != States.AUTH:
+                if self.input_tokens < 1:
+                    return True
+                self.input_tokens -= 1
+            elif self.server.pending_logins >= LOGIN_QUEUE_LIMIT:
+                # login storm, wait for the queue to drain
+                return True
+            self.handle_key(self.input_queue.popleft())
+        return False
+
+    def run_auth(self, func, args, done):
+        # func(*args) runs on the executor
+        self.server.reactor.run_in_executor(func, args, self.auth_step(done))
+
+    def auth_step(self, done):
+        # the handler is pending until the returned callback is called on
+        # the loop, it passes on to done(result, error) unless the
+        # connection is gone by then
+        def finished(result, error):
+            self.pending = False
+            self.server.pending_logins -= 1
+            if self.shutdown:
+                return
+            done(result, error)
+            self.server.redraw(self)
+            # continue with input that arrived meanwhile
+            self.server.activate(self)
+        self.pending = True
+        self.server.pending_logins += 1
+        return finished
+
+    def auth_failed(self, message, error = None):
+        if error:
+            print error
+        self.authstep = 0
+        self.password = None
+        self.session = None
+        self.send_data(Auth.error(message))
+        self.send_data(Auth.username())
+
+    def lookup_user(self, username):
+        # a player back within the session ttl needs no database
+        self.session = self.server.sessions.get(username)
+        if self.session:
+            self.user_found(username, self.session.userobject, None)
+            return
+        def found(userobject, error):
+            self.user_found(username, userobject, error)
+        self.run_auth(find_user, (username,), found)
+
+    def user_found(self, username, userobject, error):
+        if error:
+            self.auth_failed('login not possible, try again', error)
+        elif userobject:
+            self.userobject = userobject
+            # sqlite hands back unicode, frames are byte strings
+            self.username = str(userobject.username)
+            self.password = userobject.password
+            self.send_data(Auth.password())
+            self.authstep = 1
+        else:
+            self.username = username
+            self.send_data(Auth.newpassword())
+            self.authstep = 1
+
+    def handle_key(self, key):
+        if self.state == States.AUTH:
+            # the client is still in line mode
+            if key == ENTER:
+                line = self.line
+                self.line = ''
+                self.handle_line(line.strip())
+            elif key in BACKSPACE:
+                self.line = self.line[:-1]
+            elif len(key) == 1 and len(self.line) < MAX_LINE_LENGTH:
+                self.line += key
+            return
+        if key == ESC:
+            self.handle_close()
+            return
+        # World Keyset
+        if self.state == States.WORLD:
+            if key in ('w', 'W', '\x1b[A'):
+                self.entity.move(0, -1)
+            elif key in ('s', 'S', '\x1b[B'):
+                self.entity.move(0, 1)
+            elif key in ('a', 'A', '\x1b[D'):
+                self.entity.move(-1, 0)
+            elif key in ('d', 'D', '\x1b[C'):
+                self.entity.move(1, 0)
+            elif key in ('i', 'I'):
+                self.state = States.INVENTORY
+                #item_list = []
+                #for item in self.user.items:
+                #    item_list.append(item.readname)
+                #self.user.info = ', '.join(item_list)
+        # Inventory Keyset
+        elif self.state == States.INVENTORY:
+            if self.inventory.stale and key in ('e', 'E', 'd', 'D'):
+                # an earlier key of this tick changed the items, the view
+                # is only rebuilt at render
+                self.inventory.load(self.user)
+            if key in ('i', 'I'):
+                self.state = States.WORLD
+            elif key in ('\x1b[D', '\x1b[A'):
+                if self.inventory.selected_index > -3:
+                    self.inventory.selected_index -= 1
+            elif key in ('\x1b[C', '\x1b[B'):
+                if self.inventory.selected_index < self.inventory.item_count -1:
+                    self.inventory.selected_index += 1
+            elif key in ('e', 'E'):
+                section, selected_charitem = self.inventory.get_selected_charitem()
+                if selected_charitem:
+                    if section == ItemSection.EQUIPPED:
+                        if self.inventory.item_count < 8:
+                            self.user.unequip_item(selected_charitem.item)
                         else:
-                            try:
-                                #FIXME: get attributs from classes and races
-                                user = Users.create(username=self.username, password=datastrip)
-                                char = Char.create(user = user, level=ATTRIBUTES['level'], experience=ATTRIBUTES['experience'], health=ATTRIBUTES['health'], mana=ATTRIBUTES['mana'], strength=ATTRIBUTES['strength'], dexterity=ATTRIBUTES['dexterity'], zonex=ATTRIBUTES['zonex'], zoney=ATTRIBUTES['zoney'])
-                                self.state = States.WORLD
-                                self.set_char_mode(True)
-                                px, py = self.world.get_zone(char.zonex, char.zoney).find_free_place()
-                                self.entity = self.world.add_entity(char.zonex, char.zoney, px, py, set_color("@", Colors.YELLOWBOLD)) # player entity
-                                self.world.get_zone(char.zonex, char.zoney).set_entity(self.entity)
-                                self.user = User(self.username, self.entity, char, self.inventory)
-                                self.inventory.fetch_item_count(self.user)
-                                self.entity.basis = self.user
-                            except Exception, e:
-                                print e
+                            self.inventory.info_text = 'just can carry %s items' % (self.inventory.item_count,)
+                    elif section == ItemSection.EQUIPMENT:
+                        self.user.equip_item(selected_charitem.item)
+                    elif section == ItemSection.POTION:
+                        self.user.health = self.user.health + selected_charitem.item.health
+                        self.user.mana = self.user.mana + selected_charitem.item.mana
+                        self.user.strength = self.user.strength + selected_charitem.item.strength
+                        self.user.dexterity = self.user.dexterity + selected_charitem.item.dexterity
+                        self.user.delete_charitem(selected_charitem)
+            elif key in ('d', 'D'):
+                section, char_item = self.inventory.get_selected_charitem()
+                if char_item:
+                    self.user.delete_charitem(char_item)
+
+        self.server.interest.follow(self)
+        self.server.redraw(self)
+
+    def handle_line(self, datastrip):
+        if check_ascii(datastrip) and len(datastrip) <= 8:
+            if self.authstep == 0:
+                self.lookup_user(datastrip)
+            elif self.authstep == 1:
+                # the key derivation runs in the password worker processes
+                if self.password:
+                    self.server.passwords.verify(self.server.reactor, datastrip, self.password, self.auth_step(self.password_checked))
                 else:
-                    self.authstep = 0
-                    self.password = None
-                    self.send(Auth.error('incorrect input'))
-                    self.send(Auth.username())
+                    self.server.passwords.hash(self.server.reactor, datastrip, self.auth_step(self.password_hashed))
+        else:
+            self.auth_failed('incorrect input')
+        self.server.redraw(self)
+        #print '[%s] %s' % (self.__address[0], datastrip)
 
-            else:
-                key = datastrip
-                if key in ('\x1b^['):
-                    self.handle_close()
-                # World Keyset
-                if self.state == States.WORLD:
-                    if key in ('w', 'W', '\x1b[A'):
-                        self.entity.move(0, -1)
-                    elif key in ('s', 'S', '\x1b[B'):
-                        self.entity.move(0, 1)
-                    elif key in ('a', 'A', '\x1b[D'):
-                        self.entity.move(-1, 0)
-                    elif key in ('d', 'D', '\x1b[C'):
-                        self.entity.move(1, 0)
-                    elif key in ('i', 'I'):
-                        self.state = States.INVENTORY
-                        #item_list = []
-                        #for item in self.user.items:
-                        #    item_list.append(item.readname)
-                        #self.user.info = ', '.join(item_list)
-                # Inventory Keyset
-                elif self.state == States.INVENTORY:
-                    if key in ('i', 'I'):
-                        self.state = States.WORLD
-                    elif key in ('\x1b[D', '\x1b[A'):
-                        if self.inventory.selected_index > -3:
-                            self.inventory.selected_index -= 1
-                    elif key in ('\x1b[C', '\x1b[B'):
-                        if self.inventory.selected_index < self.inventory.item_count -1:
-                            self.inventory.selected_index += 1
-                    elif key in ('e', 'E'):
-                        section, selected_charitem = self.inventory.get_selected_charitem()
-                        if selected_charitem:
-                            if section == ItemSection.EQUIPPED:
-                                if self.inventory.item_count < 8:
-                                    self.user.unequip_item(selected_charitem.item)
-                                else:
-                                    self.inventory.info_text = 'just can carry %s items' % (self.inventory.item_count,)
-                            elif section == ItemSection.EQUIPMENT:
-                                self.user.equip_item(selected_charitem.item)
-                            elif section == ItemSection.POTION:
-                                self.user.health = self.user.health + selected_charitem.item.health
-                                self.user.mana = self.user.mana + selected_charitem.item.mana
-                                self.user.strength = self.user.strength + selected_charitem.item.strength
-                                self.user.dexterity = self.user.dexterity + selected_charitem.item.dexterity
-                                self.user.delete_charitem(selected_charitem)
-                    elif key in ('d', 'D'):
-                        section, char_item = self.inventory.get_selected_charitem()
-                        if char_item:
-                            self.user.delete_charitem(char_item)
-
-                self.server.run_all_handler()
-
-            self.run = True
-            #print '[%s] %s' % (self.__address[0], datastrip)
-
-    def send_data(self, data):
-        self.send(data)
+    def password_checked(self, result, error):
+        if error:
+            self.auth_failed('login not possible, try again', error)
+            return
+        valid, rehashed = result
+        if not valid:
+            self.auth_failed('wrong password')
+            return
+        session = self.session
+        self.session = None
+        if session and not rehashed and self.server.sessions.pop(self.username, session):
+            self.inventory = session.inventory
+            self.enter_world(session.char, session.inventory.item_count, session.position)
+            self.server.login(self)
+            return
+        self.run_auth(load_character, (self.userobject, rehashed), self.character_loaded)
+
+    def password_hashed(self, hashed, error):
+        if error:
+            self.auth_failed('could not create account', error)
+            return
+        self.run_auth(create_account, (self.username, hashed), self.account_created)
+
+    def character_loaded(self, result, error):
+        if error:
+            self.auth_failed('login not possible, try again', error)
+            return
+        char, item_count = result
+        self.enter_world(char, item_count)
+        self.server.login(self)
+
+    def account_created(self, result, error):
+        if error:
+            # most likely somebody else took the name meanwhile
+            self.auth_failed('could not create account', error)
+            return
+        self.userobject, char = result
+        self.enter_world(char, 0)
+        self.server.login(self)
+
+    def enter_world(self, char, item_count = None, position = None):
+        # only world work here, the database work is done by then
+        zone = self.world.get_zone(char.zonex, char.zoney)
+        if position is None or not zone.is_free(*position):
+            position = zone.find_free_place()
+        px, py = position
+        self.state = States.WORLD
+        self.set_char_mode(True)
+        self.entity = self.world.add_entity(char.zonex, char.zoney, px, py, set_color("@", Colors.YELLOWBOLD)) # player entity
+        zone.set_entity(self.entity)
+        self.user = User(self.username, self.entity, char, self.inventory)
+        if item_count is None:
+            self.inventory.fetch_item_count(self.user)
+        else:
+            self.inventory.item_count = item_count
+        self.entity.basis = self.user
+
+    def snapshot(self):
+        # session state for a hot restart, a connection still logging in
+        # starts over with the username prompt. What the client sent goes
+        # base64 encoded, json only takes utf-8
+        state = {'address': list(self.__address), 'protocol': self.protocol, 'state': States.AUTH, 'window_size': self.window_size, 'terminal_type': self.terminal_type and encode(self.terminal_type)}
+        if self.state in (States.WORLD, States.INVENTORY) and self.entity and not self.shutdown:
+            state.update({
+                'state': self.state,
+                'username': encode(self.username),
+                'position': [self.entity.x, self.entity.y],
+                'selected_index': self.inventory.selected_index,
+                'keys': [encode(key) for key in self.input_queue],
+            })
+        return state
+
+    def restore(self, state):
+        # runs in the new process before the transport is made
+        self.window_size = state['window_size'] and tuple(state['window_size'])
+        self.terminal_type = state['terminal_type'] and decode(state['terminal_type'])
+        self.screen.configure(terminal_profile(self.terminal_type), self.window_size)
+        if state['state'] == States.AUTH:
+            return
+        try:
+            self.userobject = Users.get(Users.username == decode(state['username']))
+            char = Char.get(Char.user == self.userobject)
+        except Exception, e:
+            print e
+            return
+        self.username = str(self.userobject.username)
+        self.password = self.userobject.password
+        self.enter_world(char, position = tuple(state['position']))
+        self.state = state['state']
+        self.inventory.selected_index = state['selected_index']
+        for key in state['keys']:
+            self.input_queue.append(decode(key))
+
+    def drop_backlog(self):
+        # slow client, the newest frame wins over the queued ones, control
+        # data is never dropped
+        if self.transport.backlog() < OUTPUT_QUEUE_FRAMES:
+            return
+        dropped = self.transport.drop_frames()
+        if dropped:
+            self.server.dropped_frames += dropped
+            self.resync()
+
+    def resync(self):
+        # the client missed frames, the next one is sent in full
+        self.screen.reset()
+
+    def send_data(self, data, frame = False):
+        # queued until the flush phase, one socket write per frame
+        if not self.frame:
+            self.server.outgoing.add(self)
+        if not frame:
+            self.frame_only = False
+        self.frame.append(data)
+
+    def flush(self):
+        if not self.frame:
+            return
+        data = ''.join(self.frame)
+        self.frame = []
+        kind = FRAME if self.frame_only else CONTROL
+        self.frame_only = True
+        syscalls = self.transport.syscalls
+        self.transport.write(data, kind)
+        self.frame_bytes = len(data)
+        self.frame_syscalls = self.transport.syscalls - syscalls
+        self.bytes_sent += self.frame_bytes
+        self.frames_sent += 1
+        self.server.frames_sent += 1
+        self.server.frame_bytes += self.frame_bytes
+        self.server.syscalls += self.frame_syscalls
 
     def handle_close(self):
-        self.world.remove_entity(self.entity)
+        self.transport.close()
+
+    def connection_lost(self, error):
+        if self.entity:
+            self.world.remove_entity(self.entity)
+            if self.user:
+                self.server.sessions.put(self.username, Session(self.userobject, self.user.char, self.inventory, (self.entity.x, self.entity.y)))
         self.shutdown = True
-        self.server.run_all_handler()
-        self.close()
+        self.server.scheduler.cancel(self.refresh_timer)
+        self.server.scheduler.cancel(self.idle_timer)
+        self.server.connections.pop(self.__address, None)
+        self.server.outgoing.discard(self)
+        self.server.active.discard(self)
+        self.server.dirty.discard(self)
+        if self.state:
+            self.server.logout(self)
 
-class GameServer(asyncore.dispatcher):
+class GameServer(Listener):
 
-    def __init__(self, host, port, world):
-        asyncore.dispatcher.__init__(self)
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.set_reuse_addr()
-        self.bind((host, port))
-        self.listen(CONNECTION_SIZE)
-        self.handler = None
+    def __init__(self, host, port, world, scheduler, passwords, sock = None):
+        Listener.__init__(self, scheduler.reactor, host, port, LISTEN_BACKLOG, sock)
+        self.passwords = passwords
+        # players who left recently, reconnects skip the database
+        self.sessions = SessionCache(SESSION_TTL, SESSION_CACHE_SIZE)
+        # handler classes by protocol, other frontends add theirs
+        self.handlers = {GameHandler.protocol: GameHandler}
         self.connections = dict()
         self.world = world
+        self.scheduler = scheduler
+        self.outgoing = set()
+        # handlers with queued input
+        self.active = set()
+        # handlers needing a full redraw
+        self.dirty = set()
+        self.interest = InterestManager()
+        # players in the world by name, roster_changed tells render
+        self.roster = Roster(ROSTER_WIDTH)
+        self.roster_changed = False
+        # logins waiting for or running on the executor
+        self.pending_logins = 0
+        # handlers that used up their input this tick
+        self.answered = []
+        # output counters
+        self.frames_sent = 0
+        self.frame_bytes = 0
+        self.syscalls = 0
+        self.dropped_frames = 0
+        # connections closed for timing out in login or idling
+        self.reaped_auth = 0
+        self.reaped_idle = 0
 
-    def handle_accept(self):
-        pair = self.accept()
-        if pair is not None:
-            sock, addr = pair
-            print 'Incoming connection from %s' % repr(addr)
-            self.connections[addr] = GameHandler(pair, self.world, self)
+    def handle_accept(self, sock, addr):
+        self.accept(sock, addr, GameHandler)
 
-    def run_all_handler(self):
+    def accept(self, sock, addr, handler_class):
+        print 'Incoming connection from %s' % repr(addr)
+        handler = handler_class(addr, self.world, self)
+        self.connections[addr] = handler
+        Transport(self.reactor, sock, handler, OUTPUT_QUEUE_LIMIT)
+
+    def detach(self):
+        # stops all connections for a hot restart, returns their state and
+        # the descriptors the new process needs
+        self.flush()
+        Listener.detach(self)
+        sessions = []
         for handler in self.connections.values():
-            handler.run = True
+            session = handler.snapshot()
+            session['fd'] = handler.transport.fileno()
+            session['pending'] = encode(handler.transport.detach())
+            sessions.append(session)
+        return sessions
+
+    def attach(self, sessions):
+        # the hot restart failed, carry on with the same connections
+        Listener.attach(self)
+        for session in sessions:
+            host, port = session['address']
+            handler = self.connections.get((str(host), port))
+            if handler:
+                handler.compressed = False
+                handler.transport.attach(decode(session['pending']))
+                handler.negotiate()
+                self.redraw(handler)
+        self.scheduler.wake()
+
+    def adopt(self, sessions):
+        # connections handed over by the previous process
+        for session in sessions:
+            host, port = session['address']
+            address = (str(host), port)
+            handler_class = self.handlers.get(session.get('protocol'), GameHandler)
+            handler = handler_class(address, self.world, self)
+            handler.restore(session)
+            self.connections[address] = handler
+            transport = Transport(self.reactor, take_socket(session['fd']), handler, OUTPUT_QUEUE_LIMIT)
+            # the rest of the old output goes out before anything new
+            transport.write(decode(session['pending']))
+
+    def activate(self, handler):
+        self.active.add(handler)
+        self.scheduler.wake()
+
+    def update(self):
+        # simulate phase
+        active = self.active
+        self.active = set()
+        for handler in active:
+            if handler.update():
+                self.activate(handler)
+            elif not handler.input_queue:
+                self.answered.append(handler)
+
+    def redraw(self, handler):
+        handler.run = True
+        self.dirty.add(handler)
+
+    def login(self, handler):
+        self.interest.follow(handler)
+        self.roster.add(handler.username)
+        self.roster_changed = True
+
+    def logout(self, handler):
+        self.interest.unsubscribe(handler)
+        self.roster.remove(handler.username)
+        self.roster_changed = True
+        self.scheduler.wake()
+
+    def flush(self):
+        outgoing = self.outgoing
+        self.outgoing = set()
+        for handler in outgoing:
+            handler.flush()
+        # key to flush latency, output for the keys is on its way now
+        now = time.time()
+        latency = self.scheduler.metrics.histogram('client.latency')
+        for handler in self.answered:
+            if handler.input_received is not None:
+                latency.record(now - handler.input_received)
+                handler.input_received = None
+        self.answered = []
 
     def handle_close(self):
         self.close()
@@ -0,0 +1,64 @@
+#
+#   session.py
+#
+import collections
+import time
+
+#
+#   What a player left behind on disconnect, enough to put them back into
+#   the world without asking the database
+#
+class Session(object):
+    def __init__(self, userobject, char, inventory, position):
+        self.userobject = userobject
+        self.char = char
+        self.inventory = inventory
+        self.position = position
+        self.expires = None
+
+#
+#   Recently disconnected players by username, oldest first
+#
+class SessionCache(object):
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._sessions = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def expire(self, now = None):
+        now = time.time() if now is None else now
+        while self._sessions:
+            username, session = next(self._sessions.iteritems())
+            if session.expires > now:
+                break
+            del self._sessions[username]
+
+    def put(self, username, session):
+        now = time.time()
+        session.expires = now + self.ttl
+        self._sessions.pop(username, None)
+        self._sessions[username] = session
+        self.expire(now)
+        while len(self._sessions) > self.size:
+            self._sessions.popitem(last = False)
+
+    def get(self, username):
+        self.expire()
+        session = self._sessions.get(username)
+        if session:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return session
+
+    def pop(self, username, session):
+        # takes the session if it is still the one handed out by get()
+        if self._sessions.get(username) is session:
+            del self._sessions[username]
+            return True
+        return False
@@ -4,16 +4,22 @@
 import random
 from config import WORLD_SEED, config, Item, Enemy, User
 from copy import copy
-from lib.static import Colors
+from lib.static import Colors, set_color
 from lib.pnoise import PerlinNoise
+from lib.screen import rows
 
 ZONE_WIDTH = 48
 ZONE_HEIGHT = 18
 
 TILES = {
-    0: ' ', 1: Colors.GREEN+'#'+Colors.RESET, 2: Colors.BLUE+'~'+Colors.RESET, 3: '#'
+    0: ' ', 1: set_color('#', Colors.GREEN), 2: set_color('~', Colors.BLUE), 3: '#'
 }
 
+def tile_cell(tile):
+    # the screen cell of a tile, plain or made by set_color()
+    cells = rows(tile)[0]
+    return cells[0] if cells else ' '
+
 #
 #   General purpose 2D map object
 #
@@ -44,6 +50,10 @@ class CellMap(object):
     def clear(self):
         self._cells = {}
 
+    def values(self):
+        # cleared cells hold None
+        return [data for data in self._cells.itervalues() if data is not None]
+
 
 #
 #   Entity abstraction
@@ -59,8 +69,8 @@ class Entity(object):
         self.basis = basis
         #self.move(0, 0) # link
 
-    def render_world(self):
-        return self._world.get_zone(self.zone_x, self.zone_y).render()
+    def render_rows(self):
+        return self._world.get_zone(self.zone_x, self.zone_y).render_rows()
 
     def move(self, dx, dy):
         zone = self._world.get_zone(self.zone_x, self.zone_y)
@@ -162,7 +172,19 @@ class World(object):
         self._zones = {}
         self._enemies = []
         self._items = []
-        pass
+        self._dirty_zones = set()
+
+    def touch_zone(self, x, y):
+        self._dirty_zones.add((x, y))
+
+    def pop_dirty_zones(self):
+        dirty_zones = self._dirty_zones
+        self._dirty_zones = set()
+        return dirty_zones
+
+    def stats(self):
+        # sizes of the lazily grown world, nothing here shrinks yet
+        return [('world.zones', len(self._zones)), ('world.enemies', len(self._enemies)), ('world.items', len(self._items))]
 
     def get_zone(self, x, y):
         zone_id = '%dx%d' % (x, y)
@@ -190,8 +212,18 @@ class Zone(object):
         self._world = world
         self._tilemap = CellMap(ZONE_WIDTH, ZONE_HEIGHT)
         self._entitymap = CellMap(ZONE_WIDTH, ZONE_HEIGHT)
+        # rendering shared by every viewer, dropped on the next change
+        self._rows = None
+        # counts the changes, for caches kept outside the zone
+        self.version = 0
 
         self.generate3()
+        # the terrain is made into screen cells once, entities are laid
+        # over it and only the rows they entered or left are built again
+        self._terrain = [tuple(tile_cell(TILES.get(self._tilemap.get_cell(x, y), ' ')) for x in range(ZONE_WIDTH)) for y in range(ZONE_HEIGHT)]
+        self._overlay = {}
+        self._lines = list(self._terrain)
+        self._dirty_lines = set()
 
         for e in range(random.randint(0, 4)):
             enemy = config.enemies[random.choice(config.enemies.keys())]
@@ -361,6 +393,8 @@ class Zone(object):
             if type(entity.basis) is User:
                 if random.randint(0, 100) < 10:
                     entity.basis.health = entity.basis.health - 1
+                    # nothing moved, but the victim's status line changed
+                    self.touch(y)
                 return True
             elif type(entity.basis) is Enemy and type(caller.basis) is User:
                 block, exp = entity.damage(1)
@@ -388,29 +422,63 @@ class Zone(object):
                 return True
         return False
 
-    def render(self):
-        data = []
-        for y in range(ZONE_HEIGHT):
-            for x in range(ZONE_WIDTH):
-                entity = self._entitymap.get_cell(x, y)
-                if entity:
-                    data.append(entity.tile)
-                else:
-                    data.append(TILES.get(self._tilemap.get_cell(x, y), ' '))
-            data.append('\n')
-        return ''.join(data)
+    def render_rows(self):
+        # built once per change no matter how many players look at it
+        if self._rows is None:
+            self._build_lines()
+            self._rows = tuple(self._lines) + ((),)
+        return self._rows
+
+    def _build_lines(self):
+        for y in self._dirty_lines:
+            cells = self._terrain[y]
+            overlay = self._overlay.get(y)
+            if overlay:
+                cells = list(cells)
+                for x, entity in overlay.iteritems():
+                    cells[x] = tile_cell(entity.tile)
+                cells = tuple(cells)
+            self._lines[y] = cells
+        self._dirty_lines.clear()
+
+    def terrain(self):
+        # tile ids row by row, the terrain never changes once generated
+        return [self._tilemap.get_cell(x, y) or 0 for y in range(ZONE_HEIGHT) for x in range(ZONE_WIDTH)]
+
+    def entities(self):
+        return self._entitymap.values()
+
+    def touch(self, y):
+        self._dirty_lines.add(y)
+        self._rows = None
+        self.version += 1
+        self._world.touch_zone(self._zone_x, self._zone_y)
 
     def remove_entity(self, entity):
+        if not self._entitymap.inboard(entity.x, entity.y):
+            return
         self._entitymap.set_cell(entity.x, entity.y, None)
+        overlay = self._overlay.get(entity.y)
+        if overlay:
+            overlay.pop(entity.x, None)
+            if not overlay:
+                del self._overlay[entity.y]
+        self.touch(entity.y)
 
     def set_entity(self, entity):
+        if not self._entitymap.inboard(entity.x, entity.y):
+            return
         self._entitymap.set_cell(entity.x, entity.y, entity)
+        self._overlay.setdefault(entity.y, {})[entity.x] = entity
+        self.touch(entity.y)
+
+    def is_free(self, x, y):
+        return self._tilemap.get_cell(x, y) == 0 and not self._entitymap.get_cell(x, y)
 
     def find_free_place(self):
         while True:
             x = random.randint(0, ZONE_WIDTH-1)
             y = random.randint(0, ZONE_HEIGHT-1)
-            if self._tilemap.get_cell(x, y) == 0:
-                if not self._entitymap.get_cell(x, y):
-                    return x, y
+            if self.is_free(x, y):
+                return x, y
 